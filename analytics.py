@@ -0,0 +1,74 @@
+from sqlalchemy import select
+
+from models import P2PTransaction, DailyRollup
+
+PERIODS = {'day': 'D', 'week': 'W', 'month': 'M'}
+DAILY_COLUMNS = ['buy_amount', 'buy_count', 'sell_amount', 'sell_count']
+ANALYTICS_PERIODS = 12  # сколько последних периодов показывать
+
+async def load_daily_frame(session, user_id):
+    """Дневные итоги пользователя из daily_rollups, а без них - из самих транзакций"""
+    # pandas нужен только аналитике - не загружаем его при старте бота
+    import pandas as pd
+    rows = (await session.execute(
+        select(DailyRollup.day, *(getattr(DailyRollup, c) for c in DAILY_COLUMNS))
+        .where(DailyRollup.user_id == user_id)
+        .order_by(DailyRollup.day)
+    )).all()
+    if rows:
+        frame = pd.DataFrame.from_records(rows, columns=['day'] + DAILY_COLUMNS)
+        return frame.set_index(pd.to_datetime(frame.pop('day')))
+
+    rows = (await session.execute(
+        select(P2PTransaction.date, P2PTransaction.transaction_type, P2PTransaction.amount)
+        .where(P2PTransaction.user_id == user_id)
+    )).all()
+    return daily_frame(pd.DataFrame.from_records(rows, columns=['date', 'transaction_type', 'amount']))
+
+def daily_frame(transactions):
+    """Сворачивает транзакции (date, transaction_type, amount) в дневные итоги"""
+    import numpy as np
+    import pandas as pd
+    if transactions.empty:
+        return pd.DataFrame(columns=DAILY_COLUMNS, index=pd.DatetimeIndex([], name='day'))
+    is_buy = (transactions['transaction_type'] == 'buy').to_numpy()
+    is_sell = (transactions['transaction_type'] == 'sell').to_numpy()
+    amounts = transactions['amount'].to_numpy(dtype=float)
+    frame = pd.DataFrame({
+        'buy_amount': np.where(is_buy, amounts, 0.0),
+        'buy_count': is_buy.astype(int),
+        'sell_amount': np.where(is_sell, amounts, 0.0),
+        'sell_count': is_sell.astype(int),
+    }, index=pd.DatetimeIndex(pd.to_datetime(transactions['date']).dt.normalize(), name='day'))
+    return frame.groupby(level=0).sum()
+
+def rollup(daily, period):
+    """Итоги по периодам: объемы, чистый поток, накопленные вложения и средний чек"""
+    import numpy as np
+    import pandas as pd
+    grouped = daily.groupby(daily.index.to_period(PERIODS[period])).sum()
+    buy = grouped['buy_amount'].to_numpy(dtype=float)
+    sell = grouped['sell_amount'].to_numpy(dtype=float)
+    tickets = (grouped['buy_count'] + grouped['sell_count']).to_numpy(dtype=float)
+    net = buy - sell
+    return pd.DataFrame({
+        'buy': buy,
+        'sell': sell,
+        'net': net,
+        'invested': np.cumsum(net),
+        'count': tickets.astype(int),
+        'avg_ticket': np.divide(buy + sell, tickets, out=np.zeros_like(tickets), where=tickets > 0),
+    }, index=grouped.index)
+
+def summarize(daily, period, limit=ANALYTICS_PERIODS):
+    """Последние limit периодов и средний чек за всю историю"""
+    periods = rollup(daily, period)
+    # Дни, опустевшие после редактирования, не показываем
+    periods = periods[periods['count'] > 0]
+    volume = float(daily['buy_amount'].sum() + daily['sell_amount'].sum())
+    count = int(daily['buy_count'].sum() + daily['sell_count'].sum())
+    return {
+        'periods': periods.tail(limit),
+        'avg_ticket': volume / count if count else 0.0,
+        'count': count,
+    }
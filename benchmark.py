@@ -0,0 +1,304 @@
+"""Нагрузочный тест бота без сети.
+
+Собирает настоящий Dispatcher через handlers.register_handlers, подменяет
+сессию Bot заглушкой, которая записывает исходящие вызовы, и прогоняет
+синтетические апдейты от множества пользователей через dp.feed_update.
+
+Пример:
+    python benchmark.py --rows 1000000 --users 1000 --concurrency 200 --output bench.json
+"""
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import logging
+import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Бенчмарк не должен поднимать фоновые задачи и HTTP-эндпоинты бота
+os.environ.setdefault("BOT_TOKEN", "123456:BENCHMARK")
+os.environ.setdefault("ADMIN_ID", "1")
+os.environ["METRICS_PORT"] = "0"
+os.environ["BYBIT_SYNC_INTERVAL"] = "0"
+os.environ["DIGEST_CHECK_INTERVAL"] = "0"
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.types import Update, Message, Chat, User, CallbackQuery, InlineKeyboardMarkup
+
+from config import SQLITE_PRAGMAS, logger
+from models import init_async_db
+from handlers import register_handlers
+from storage import SQLiteStorage
+
+FIRST_USER_ID = 1_000_000
+SEED_BATCH = 50_000
+FLOWS = ('add', 'edit', 'statistics', 'list')
+
+class RecordingSession(BaseSession):
+    """Сессия Bot, которая ничего не отправляет, а запоминает вызовы"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+        self.last_markup = {}  # chat_id -> последняя inline-клавиатура
+        self.error_replies = collections.Counter()  # chat_id -> ответы с "❌"
+        self._message_ids = itertools.count(1)
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout=None):
+        self.calls += 1
+        chat_id = getattr(method, 'chat_id', None)
+        markup = getattr(method, 'reply_markup', None)
+        text = getattr(method, 'text', None)
+        if chat_id is not None and isinstance(text, str) and text.startswith('❌'):
+            self.error_replies[chat_id] += 1
+        if chat_id is not None and isinstance(markup, InlineKeyboardMarkup):
+            self.last_markup[chat_id] = markup
+        if method.__returning__ is Message:
+            return Message(
+                message_id=next(self._message_ids),
+                date=datetime.now(),
+                chat=Chat(id=chat_id or 0, type='private'),
+                text=text
+            )
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b''
+
+    async def close(self):
+        pass
+
+class UpdateFactory:
+    def __init__(self):
+        self._ids = itertools.count(1)
+
+    def message(self, user_id, text):
+        user = User(id=user_id, is_bot=False, first_name='bench')
+        return Update(update_id=next(self._ids), message=Message(
+            message_id=next(self._ids), date=datetime.now(),
+            chat=Chat(id=user_id, type='private'), from_user=user, text=text
+        ))
+
+    def callback(self, user_id, data):
+        user = User(id=user_id, is_bot=False, first_name='bench')
+        message = Message(
+            message_id=next(self._ids), date=datetime.now(),
+            chat=Chat(id=user_id, type='private'), from_user=user, text='bench'
+        )
+        return Update(update_id=next(self._ids), callback_query=CallbackQuery(
+            id=str(next(self._ids)), from_user=user, chat_instance='bench',
+            message=message, data=data
+        ))
+
+def seed_database(path, rows, users):
+    """Заполняет p2p_transactions синтетической историей, если таблица пуста"""
+    connection = sqlite3.connect(path)
+    try:
+        existing = connection.execute('SELECT COUNT(*) FROM p2p_transactions').fetchone()[0]
+        if existing >= rows:
+            return existing
+        connection.execute('PRAGMA journal_mode=OFF')
+        connection.execute('PRAGMA synchronous=OFF')
+        start = datetime(2020, 1, 1)
+        rng = random.Random(42)
+        for offset in range(existing, rows, SEED_BATCH):
+            batch = [
+                (
+                    FIRST_USER_ID + i % users,
+                    round(rng.uniform(100, 100_000), 2),
+                    'buy' if rng.random() < 0.6 else 'sell',
+                    (start + timedelta(minutes=i)).isoformat(sep=' ')
+                )
+                for i in range(offset, min(offset + SEED_BATCH, rows))
+            ]
+            connection.executemany(
+                'INSERT INTO p2p_transactions (user_id, amount, transaction_type, date) VALUES (?, ?, ?, ?)',
+                batch
+            )
+            connection.commit()
+        return rows
+    finally:
+        connection.close()
+
+class Benchmark:
+    def __init__(self, dp, bot, session):
+        self.dp = dp
+        self.bot = bot
+        self.session = session
+        self.updates = UpdateFactory()
+        self.latencies = {flow: [] for flow in FLOWS}
+        self.runs = collections.Counter()
+        self.failures = collections.Counter()
+        # Сценарии одного user_id идут по очереди, иначе их состояния FSM перемешиваются
+        self._user_locks = collections.defaultdict(asyncio.Lock)
+
+    async def feed(self, flow, update):
+        started = time.perf_counter()
+        await self.dp.feed_update(self.bot, update)
+        self.latencies[flow].append(time.perf_counter() - started)
+
+    def edit_callback(self, user_id, prefix):
+        markup = self.session.last_markup.get(user_id)
+        if markup is None:
+            return None
+        for row in markup.inline_keyboard:
+            for button in row:
+                if button.callback_data and button.callback_data.startswith(prefix):
+                    return button.callback_data
+        return None
+
+    async def run_add(self, user_id, rng):
+        kind = rng.choice(("💰 Добавить пополнение", "💸 Добавить продажу"))
+        await self.feed('add', self.updates.message(user_id, kind))
+        await self.feed('add', self.updates.message(user_id, f"{rng.randint(100, 100_000)}"))
+        await self.feed('add', self.updates.message(user_id, "📅 Использовать текущую дату"))
+
+    async def run_list(self, user_id, rng):
+        await self.feed('list', self.updates.message(user_id, "📝 Редактировать транзакции"))
+        next_page = self.edit_callback(user_id, 'txpage_next_')
+        if next_page:
+            await self.feed('list', self.updates.callback(user_id, next_page))
+        await self.feed('list', self.updates.callback(user_id, 'cancel_edit'))
+
+    async def run_edit(self, user_id, rng):
+        await self.feed('edit', self.updates.message(user_id, "📝 Редактировать транзакции"))
+        edit = self.edit_callback(user_id, 'edit_')
+        if edit is None:
+            return
+        await self.feed('edit', self.updates.callback(user_id, edit))
+        await self.feed('edit', self.updates.message(user_id, "💵 Изменить сумму"))
+        await self.feed('edit', self.updates.message(user_id, f"{rng.randint(100, 100_000)}"))
+
+    async def run_statistics(self, user_id, rng):
+        await self.feed('statistics', self.updates.message(user_id, "📊 Статистика"))
+
+    async def run_user(self, user_id, iterations, seed):
+        rng = random.Random(seed)
+        flows = {
+            'add': self.run_add,
+            'edit': self.run_edit,
+            'statistics': self.run_statistics,
+            'list': self.run_list,
+        }
+        for _ in range(iterations):
+            flow = rng.choice(FLOWS)
+            async with self._user_locks[user_id]:
+                errors = self.session.error_replies[user_id]
+                try:
+                    await flows[flow](user_id, rng)
+                    failed = self.session.error_replies[user_id] > errors
+                except Exception as e:
+                    logger.error(f"Flow {flow} failed for user {user_id}: {e}")
+                    failed = True
+            self.runs[flow] += 1
+            self.failures[flow] += failed
+
+def percentile_report(latencies, runs, failures, elapsed):
+    report = {}
+    for flow, values in latencies.items():
+        counts = {'runs': runs[flow], 'failed': failures[flow], 'updates': len(values)}
+        if len(values) < 2:
+            report[flow] = counts
+            continue
+        cuts = statistics.quantiles(values, n=100)
+        report[flow] = {
+            **counts,
+            'throughput_per_s': round(len(values) / elapsed, 1),
+            'p50_ms': round(cuts[49] * 1000, 3),
+            'p95_ms': round(cuts[94] * 1000, 3),
+            'p99_ms': round(cuts[98] * 1000, 3),
+        }
+    return report
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), text=True
+        ).strip()
+    except Exception:
+        return None
+
+async def run(args):
+    db_path = args.db or os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+    session_factory = await init_async_db(f"sqlite:///{db_path}", sqlite_pragmas=SQLITE_PRAGMAS)
+
+    # Соединение пула держит базу в режиме WAL, а seed_database переключает
+    # journal_mode - закрываем пул, новые соединения снова получат PRAGMA
+    await session_factory.kw['bind'].dispose()
+    seeding_started = time.perf_counter()
+    seeded = await asyncio.to_thread(seed_database, db_path, args.rows, args.users)
+    seeding_time = time.perf_counter() - seeding_started
+
+    recording = RecordingSession()
+    bot = Bot(token=os.environ["BOT_TOKEN"], session=recording)
+    storage = SQLiteStorage(session_factory)
+    dp = Dispatcher(storage=storage)
+    await register_handlers(dp, session_factory)
+    await dp.emit_startup(dispatcher=dp, bots=[bot], bot=bot, **dp.workflow_data)
+
+    benchmark = Benchmark(dp, bot, recording)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def simulate(index):
+        async with semaphore:
+            await benchmark.run_user(FIRST_USER_ID + index % args.users, args.iterations, index)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(simulate(i) for i in range(args.simulated_users)))
+    elapsed = time.perf_counter() - started
+
+    await dp.emit_shutdown(dispatcher=dp, bots=[bot], bot=bot, **dp.workflow_data)
+
+    total_updates = sum(len(values) for values in benchmark.latencies.values())
+    return {
+        'revision': git_revision(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'params': {
+            'rows': seeded,
+            'users': args.users,
+            'simulated_users': args.simulated_users,
+            'iterations': args.iterations,
+            'concurrency': args.concurrency,
+        },
+        'seeding_seconds': round(seeding_time, 2),
+        'elapsed_seconds': round(elapsed, 3),
+        'updates': total_updates,
+        'throughput_per_s': round(total_updates / elapsed, 1),
+        'bot_calls': recording.calls,
+        'failed_flows': sum(benchmark.failures.values()),
+        'flows': percentile_report(benchmark.latencies, benchmark.runs, benchmark.failures, elapsed),
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test for the bot handlers")
+    parser.add_argument('--rows', type=int, default=10_000, help="P2PTransaction rows to seed")
+    parser.add_argument('--users', type=int, default=100, help="users owning the seeded rows")
+    parser.add_argument('--simulated-users', type=int, default=500, help="users sending updates")
+    parser.add_argument('--iterations', type=int, default=10, help="flows per simulated user")
+    parser.add_argument('--concurrency', type=int, default=100, help="users active at the same time")
+    parser.add_argument('--db', help="SQLite file to use (seeded rows are reused between runs)")
+    parser.add_argument('--output', help="write JSON results to this file")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.getLogger('aiogram').setLevel(logging.WARNING)
+    results = asyncio.run(run(args))
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    print(text)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,13 +1,13 @@
 import asyncio
-from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+import sys
 
-from config import BOT_TOKEN, ADMIN_ID, logger, DATABASE_URL
-from models import init_db
-from handlers import register_handlers
+from startup_profile import profiler
 
-async def on_startup(bot: Bot):
+PROFILE_STARTUP = '--profile-startup' in sys.argv
+
+async def on_startup(bot):
     """Отправляет сообщение администратору при запуске бота"""
+    from config import ADMIN_ID, logger
     try:
         await bot.send_message(
             ADMIN_ID,
@@ -17,21 +17,79 @@ async def on_startup(bot: Bot):
     except Exception as e:
         logger.error(f"Failed to send startup notification: {e}")
 
+async def profile_startup(dp, bot):
+    """Проходит запуск диспетчера без обращений к Telegram и печатает отчет"""
+    workflow_data = {'dispatcher': dp, 'bots': [bot], 'bot': bot, **dp.workflow_data}
+    try:
+        with profiler.step('dispatcher startup'):
+            await dp.emit_startup(**workflow_data)
+        print(profiler.report())
+    finally:
+        await dp.emit_shutdown(**workflow_data)
+        await bot.session.close()
+
 async def main():
+    # Модули бота загружаются здесь, а не на уровне файла: процессы рендеринга
+    # графиков (spawn) заново исполняют bot.py и не должны импортировать aiogram
+    with profiler.step('imports'):
+        from aiogram import Bot, Dispatcher
+        from config import (
+            BOT_TOKEN, DATABASE_URL, BOT_MODE, BOT_WORKERS,
+            DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, SQLITE_PRAGMAS
+        )
+        from models import init_async_db
+        from handlers import register_handlers
+        from storage import SQLiteStorage
+        from webhook import run_webhook, run_worker
+        from supervisor import run_supervisor
+
+    # Initialize database
+    with profiler.step('database'):
+        session_factory = await init_async_db(
+            DATABASE_URL,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            sqlite_pragmas=SQLITE_PRAGMAS
+        )
+    
     # Initialize bot and dispatcher
     bot = Bot(token=BOT_TOKEN)
-    storage = MemoryStorage()
-    dp = Dispatcher(storage=storage)
+    if BOT_WORKERS > 1 and BOT_MODE != 'worker' and not PROFILE_STARTUP:
+        # Схема уже создана; апдейты обрабатывают рабочие процессы
+        await session_factory.kw['bind'].dispose()
+        await on_startup(bot)
+        await run_supervisor(bot, BOT_WORKERS)
+        return
     
-    # Initialize database
-    db_session = init_db(DATABASE_URL)
+    storage = SQLiteStorage(session_factory)
+    dp = Dispatcher(storage=storage)
+    dp.startup.register(storage.start)
+    dp.shutdown.register(storage.close)
     
     # Register all handlers
-    await register_handlers(dp, db_session)
+    with profiler.step('handlers'):
+        await register_handlers(dp, session_factory)
+    # Регистрируется последним: пул закрывается после остановки всех фоновых задач
+    dp.shutdown.register(session_factory.kw['bind'].dispose)
     
     # Start bot
+    if PROFILE_STARTUP:
+        await profile_startup(dp, bot)
+        return
+    if BOT_MODE == 'worker':
+        await run_worker(dp, bot)
+        return
     await on_startup(bot)
-    await dp.start_polling(bot)
+    if BOT_MODE == 'webhook':
+        await run_webhook(dp, bot)
+    else:
+        # Polling не работает, пока у бота установлен webhook
+        await bot.delete_webhook()
+        await dp.start_polling(bot)
 
 if __name__ == '__main__':
+    if PROFILE_STARTUP:
+        # Хук ставится до импорта модулей бота, чтобы замерить их все
+        profiler.install()
     asyncio.run(main()) 
\ No newline at end of file
@@ -0,0 +1,160 @@
+import asyncio
+from datetime import datetime
+
+from sqlalchemy import select
+
+from models import BybitAccount
+from importer import insert_new_transactions
+from ratelimit import TokenBucket
+from pnl import to_quantity, to_price
+from stats import stats_cache
+from config import (
+    logger, BYBIT_API_URL, BYBIT_SYNC_INTERVAL, BYBIT_SYNC_PAGE_SIZE,
+    BYBIT_RATE_LIMIT, BYBIT_RATE_BURST, WORKER_INDEX, WORKER_COUNT
+)
+
+# Статусы ордеров Bybit P2P
+STATUS_COMPLETED = 50
+FINAL_STATUSES = {40, 50, 80}  # отменен, завершен, отменен системой
+SIDES = {0: 'buy', 1: 'sell'}
+
+def create_client(api_key, api_secret):
+    # pybit тянет requests и websocket - загружаем при первой синхронизации
+    from pybit.unified_trading import HTTP
+    client = HTTP(api_key=api_key, api_secret=api_secret)
+    if BYBIT_API_URL:
+        client.endpoint = BYBIT_API_URL.rstrip('/')
+    return client
+
+class BybitSync:
+    """Фоновая синхронизация завершенных P2P ордеров пользователей с Bybit"""
+
+    def __init__(self, session_factory, write_batcher, client_factory=create_client,
+                 interval=BYBIT_SYNC_INTERVAL, page_size=BYBIT_SYNC_PAGE_SIZE):
+        self.session_factory = session_factory
+        self.write_batcher = write_batcher
+        self.client_factory = client_factory
+        self.interval = interval
+        self.page_size = page_size
+        # Лимит запросов общий для всех пользователей бота
+        self.bucket = TokenBucket(BYBIT_RATE_LIMIT, BYBIT_RATE_BURST)
+        self._inflight = {}  # user_id -> asyncio.Task
+        self._task = None
+
+    def sync_user(self, user_id):
+        """Запускает синхронизацию; параллельные вызовы для одного пользователя ждут один запрос"""
+        task = self._inflight.get(user_id)
+        if task is None:
+            task = asyncio.create_task(self._sync_user(user_id))
+            self._inflight[user_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(user_id, None))
+        return asyncio.shield(task)
+
+    async def _fetch_page(self, client, page, begin_time):
+        params = {'page': page, 'size': self.page_size}
+        if begin_time is not None:
+            params['beginTime'] = str(begin_time)
+            params['endTime'] = str(int(datetime.now().timestamp() * 1000))
+        await self.bucket.acquire()
+        response = await asyncio.to_thread(client.get_orders, **params)
+        return response['result'].get('items') or []
+
+    async def _sync_user(self, user_id):
+        """Загружает новые ордера после курсора и возвращает число добавленных
+
+        Запросы к Bybit идут вне транзакции, каждая страница сохраняется
+        через write_batcher вместе с другими записями бота. Курсор сдвигается только после последней
+        страницы; при сбое повтор отсеет сохраненные ордера по external_id.
+        """
+        async with self.session_factory() as session:
+            account = await session.get(BybitAccount, user_id)
+            if account is None or not account.sync_enabled:
+                return 0
+            client = self.client_factory(account.api_key, account.api_secret)
+            cursor = account.last_order_time
+
+        high_water = cursor or 0
+        oldest_open = None
+        imported = 0
+        page = 1
+
+        while True:
+            items = await self._fetch_page(client, page, cursor)
+            records = []
+            for item in items:
+                created = int(item['createDate'])
+                status = int(item['status'])
+                high_water = max(high_water, created)
+                # Незавершенные ордера перечитаем в следующий раз
+                if status not in FINAL_STATUSES:
+                    oldest_open = created if oldest_open is None else min(oldest_open, created)
+                if status != STATUS_COMPLETED or int(item['side']) not in SIDES:
+                    continue
+                has_quantity = bool(item.get('quantity') and item.get('price') and item.get('tokenId'))
+                records.append({
+                    'external_id': str(item['id']),
+                    'transaction_type': SIDES[int(item['side'])],
+                    'amount': float(item['amount']),
+                    'date': datetime.fromtimestamp(created / 1000),
+                    'asset': item['tokenId'] if has_quantity else None,
+                    'quantity': to_quantity(item['quantity']) if has_quantity else None,
+                    'price': to_price(item['price']) if has_quantity else None,
+                })
+
+            if records:
+                async def save(session, records=records):
+                    return await insert_new_transactions(session, user_id, records, action='sync')
+
+                imported += await self.write_batcher.submit(save)
+            if len(items) < self.page_size:
+                break
+            page += 1
+
+        async def move_cursor(session):
+            account = await session.get(BybitAccount, user_id)
+            if account is not None:
+                account.last_order_time = oldest_open if oldest_open is not None else (high_water or None)
+                account.last_synced_at = datetime.now()
+
+        await self.write_batcher.submit(move_cursor)
+
+        if imported:
+            stats_cache.invalidate(user_id)
+        logger.info(f"Bybit sync for user {user_id}: {imported} new orders")
+        return imported
+
+    async def run_periodic(self):
+        while True:
+            try:
+                async with self.session_factory() as session:
+                    query = select(BybitAccount.user_id).filter_by(sync_enabled=True)
+                    if WORKER_COUNT > 1:
+                        # Каждый рабочий процесс синхронизирует только своих пользователей
+                        query = query.where(BybitAccount.user_id % WORKER_COUNT == WORKER_INDEX)
+                    user_ids = (await session.execute(query)).scalars().all()
+            except Exception as e:
+                logger.error(f"Failed to load Bybit accounts: {e}")
+                user_ids = []
+
+            for user_id in user_ids:
+                try:
+                    await self.sync_user(user_id)
+                except Exception as e:
+                    logger.error(f"Bybit sync failed for user {user_id}: {e}")
+
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self.run_periodic())
+
+    async def stop(self):
+        # Останавливаем и дожидаемся фоновый цикл и начатые синхронизации,
+        # чтобы они не держали соединения базы после остановки
+        tasks = list(self._inflight.values())
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
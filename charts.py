@@ -0,0 +1,111 @@
+import asyncio
+import io
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from config import logger, CHART_WORKERS, CHART_CACHE_MAX_ENTRIES
+
+def _warm_up():
+    """Загружает matplotlib в процессе-рендерере заранее"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot  # noqa: F401
+
+def render_chart(days, buy, sell):
+    """Рисует PNG: накопленные вложения и объемы пополнений/продаж по месяцам
+
+    Выполняется в отдельном процессе, поэтому принимает только массивы NumPy.
+    """
+    import numpy as np
+    import pandas as pd
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    daily = pd.DataFrame({'buy': buy, 'sell': sell}, index=pd.DatetimeIndex(days))
+    invested = np.cumsum(daily['buy'].to_numpy() - daily['sell'].to_numpy())
+    monthly = daily.groupby(daily.index.to_period('M')).sum()
+    months = monthly.index.to_timestamp()
+
+    fig, (top, bottom) = plt.subplots(2, 1, figsize=(9, 7), sharex=True)
+    top.step(daily.index, invested, where='post', color='tab:blue')
+    top.fill_between(daily.index, invested, step='post', alpha=0.15, color='tab:blue')
+    top.set_title("Вложено, ₽")
+    top.grid(alpha=0.3)
+
+    width = 12
+    bottom.bar(months, monthly['buy'], width=width, align='edge', color='tab:green', label="Пополнения")
+    bottom.bar(months, -monthly['sell'], width=width, align='edge', color='tab:red', label="Продажи")
+    bottom.axhline(0, color='black', linewidth=0.5)
+    bottom.set_title("Объем по месяцам, ₽")
+    bottom.legend(loc='best')
+    bottom.grid(alpha=0.3)
+
+    fig.autofmt_xdate()
+    fig.tight_layout()
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=100)
+    plt.close(fig)
+    return buffer.getvalue()
+
+class ChartRenderer:
+    """Рендер графиков в пуле процессов с кэшем file_id по (user_id, версия данных)"""
+
+    def __init__(self, workers=CHART_WORKERS, max_entries=CHART_CACHE_MAX_ENTRIES):
+        self.workers = workers
+        self.max_entries = max_entries
+        self.rendered = 0
+        self.hits = 0
+        self._file_ids = OrderedDict()  # (user_id, version) -> file_id
+        self._inflight = {}  # (user_id, version) -> asyncio.Future
+        self._executor = None
+
+    def cached_file_id(self, user_id, version):
+        file_id = self._file_ids.get((user_id, version))
+        if file_id is not None:
+            self._file_ids.move_to_end((user_id, version))
+            self.hits += 1
+        return file_id
+
+    def remember(self, user_id, version, file_id):
+        # Старые версии графика этого пользователя больше не понадобятся
+        for key in [key for key in self._file_ids if key[0] == user_id]:
+            del self._file_ids[key]
+        self._file_ids[(user_id, version)] = file_id
+        while len(self._file_ids) > self.max_entries:
+            self._file_ids.popitem(last=False)
+
+    def render(self, user_id, version, daily):
+        """Рисует график; одновременные запросы одной версии ждут один рендер"""
+        key = (user_id, version)
+        future = self._inflight.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(
+                self._executor, render_chart,
+                daily.index.to_numpy(),
+                daily['buy_amount'].to_numpy(dtype=float),
+                daily['sell_amount'].to_numpy(dtype=float)
+            )
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+            self.rendered += 1
+        return asyncio.shield(future)
+
+    async def start(self):
+        if self._executor is None:
+            # spawn: дочерние процессы не наследуют потоки и соединения бота
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            # Процессы запускаются и загружают matplotlib до первого запроса
+            for _ in range(self.workers):
+                self._executor.submit(_warm_up)
+            logger.info(f"Chart renderer started with {self.workers} workers")
+
+    async def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
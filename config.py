@@ -12,11 +12,102 @@ BOT_TOKEN = env("BOT_TOKEN")
 # Admin ID
 ADMIN_ID = env.int("ADMIN_ID")
 
+# Update delivery mode: "polling" or "webhook"
+BOT_MODE = env.str("BOT_MODE", "polling")
+
+# Webhook server (BOT_MODE=webhook)
+WEBHOOK_URL = env.str("WEBHOOK_URL", None)  # public base URL, e.g. https://bot.example.com
+WEBHOOK_PATH = env.str("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = env.str("WEBHOOK_SECRET", None)
+WEBHOOK_HOST = env.str("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = env.int("WEBHOOK_PORT", 8080)
+WEBHOOK_MAX_CONCURRENCY = env.int("WEBHOOK_MAX_CONCURRENCY", 100)
+WEBHOOK_DRAIN_TIMEOUT = env.float("WEBHOOK_DRAIN_TIMEOUT", 30.0)  # seconds
+
 # Database URL
 # Используем абсолютный путь для базы данных
 DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'db.sqlite3')
 DATABASE_URL = f"sqlite:///{DB_PATH}"
 
+# Database connection pool
+DB_POOL_SIZE = env.int("DB_POOL_SIZE", 5)
+DB_MAX_OVERFLOW = env.int("DB_MAX_OVERFLOW", 10)
+DB_POOL_TIMEOUT = env.float("DB_POOL_TIMEOUT", 30.0)
+
+# SQLite engine profile, applied to every new connection
+SQLITE_PRAGMAS = {
+    'journal_mode': env.str("SQLITE_JOURNAL_MODE", "WAL"),
+    'synchronous': env.str("SQLITE_SYNCHRONOUS", "NORMAL"),
+    'mmap_size': env.int("SQLITE_MMAP_SIZE", 268435456),  # bytes
+    'busy_timeout': env.int("SQLITE_BUSY_TIMEOUT", 5000),  # ms
+    'cache_size': env.int("SQLITE_CACHE_SIZE", -65536),  # negative = KiB
+}
+
+# Group commit of interactive writes
+WRITE_BATCH_WINDOW = env.float("WRITE_BATCH_WINDOW", 0.005)  # seconds to wait for more writes
+WRITE_BATCH_MAX_SIZE = env.int("WRITE_BATCH_MAX_SIZE", 100)
+
+# Statistics cache
+STATS_CACHE_MAX_ENTRIES = env.int("STATS_CACHE_MAX_ENTRIES", 10000)
+STATS_CACHE_TTL = env.int("STATS_CACHE_TTL", 300)  # seconds
+
+# Balance ledger
+LEDGER_SNAPSHOT_INTERVAL = env.int("LEDGER_SNAPSHOT_INTERVAL", 100)  # days with operations between balance snapshots
+
+# Periodic digests
+DIGEST_HOUR = env.int("DIGEST_HOUR", 9)  # local hour after which digests are sent
+DIGEST_CHECK_INTERVAL = env.int("DIGEST_CHECK_INTERVAL", 300)  # seconds, 0 disables digests
+DIGEST_BATCH_SIZE = env.int("DIGEST_BATCH_SIZE", 1000)  # subscribers per aggregation query
+
+# Profit and loss
+PNL_RATES = env.dict("PNL_RATES", {}, subcast_values=float)  # e.g. USDT=92.5,BTC=6000000
+
+# Chart rendering
+CHART_WORKERS = env.int("CHART_WORKERS", 2)  # processes rendering PNG charts
+CHART_CACHE_MAX_ENTRIES = env.int("CHART_CACHE_MAX_ENTRIES", 10000)
+
+# Bulk import
+IMPORT_CHUNK_SIZE = env.int("IMPORT_CHUNK_SIZE", 500)
+
+# Export
+EXPORT_CHUNK_SIZE = env.int("EXPORT_CHUNK_SIZE", 1000)
+
+# Bybit API sync
+BYBIT_API_URL = env.str("BYBIT_API_URL", None)  # override for a local stub server
+BYBIT_SYNC_INTERVAL = env.int("BYBIT_SYNC_INTERVAL", 900)  # seconds, 0 disables
+BYBIT_SYNC_PAGE_SIZE = env.int("BYBIT_SYNC_PAGE_SIZE", 50)
+BYBIT_RATE_LIMIT = env.float("BYBIT_RATE_LIMIT", 5.0)  # requests per second
+BYBIT_RATE_BURST = env.int("BYBIT_RATE_BURST", 10)
+
+# Multi-process mode: a supervisor routes updates to worker processes by user_id
+BOT_WORKERS = env.int("BOT_WORKERS", 1)  # more than 1 starts the supervisor
+WORKER_BASE_PORT = env.int("WORKER_BASE_PORT", 8200)  # worker i listens on 127.0.0.1:base+i
+WORKER_HEALTH_INTERVAL = env.float("WORKER_HEALTH_INTERVAL", 5.0)  # seconds
+WORKER_HEALTH_FAILURES = env.int("WORKER_HEALTH_FAILURES", 3)  # failed checks before restart
+WORKER_QUEUE_SIZE = env.int("WORKER_QUEUE_SIZE", 1000)  # updates buffered per worker
+# Set by the supervisor for its worker processes (BOT_MODE=worker)
+WORKER_INDEX = env.int("WORKER_INDEX", 0)
+WORKER_COUNT = env.int("WORKER_COUNT", 1)
+WORKER_PORT = env.int("WORKER_PORT", WORKER_BASE_PORT)
+WORKER_SECRET = env.str("WORKER_SECRET", "")
+
+# Outbound message queue
+SEND_GLOBAL_RATE = env.float("SEND_GLOBAL_RATE", 25.0)  # messages per second for the whole bot
+SEND_CHAT_RATE = env.float("SEND_CHAT_RATE", 1.0)  # messages per second per chat
+SEND_CHAT_BURST = env.int("SEND_CHAT_BURST", 3)
+SEND_QUEUE_MAX_SIZE = env.int("SEND_QUEUE_MAX_SIZE", 10000)
+SEND_QUEUE_WORKERS = env.int("SEND_QUEUE_WORKERS", 8)
+SEND_MAX_RETRIES = env.int("SEND_MAX_RETRIES", 3)
+
+# Prometheus metrics endpoint
+METRICS_HOST = env.str("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = env.int("METRICS_PORT", 9100)  # 0 disables the endpoint
+
+# FSM storage
+FSM_STATE_TTL = env.int("FSM_STATE_TTL", 86400)  # seconds until an abandoned flow expires
+FSM_CACHE_MAX_ENTRIES = env.int("FSM_CACHE_MAX_ENTRIES", 10000)
+FSM_FLUSH_INTERVAL = env.float("FSM_FLUSH_INTERVAL", 2.0)  # seconds
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__) 
\ No newline at end of file
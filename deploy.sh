@@ -10,6 +10,12 @@ docker build -t bybit-bot .
 # Создаем директорию для данных, если её нет
 mkdir -p /opt/bybit-bot/data
 
+# Применяем миграции базы данных
+docker run --rm \
+    --env-file .env \
+    -v /opt/bybit-bot/data:/app/data \
+    bybit-bot alembic upgrade head
+
 # Запуск нового контейнера
 docker run -d \
     --name bybit-bot \
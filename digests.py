@@ -0,0 +1,148 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update, func, case, and_, or_
+
+from models import P2PTransaction, DigestSubscription
+from sender import SendQueue
+from config import (
+    logger, DIGEST_HOUR, DIGEST_CHECK_INTERVAL, DIGEST_BATCH_SIZE, WORKER_INDEX, WORKER_COUNT
+)
+
+FREQUENCIES = {
+    'daily': ("день", "прошлый день"),
+    'weekly': ("неделю", "прошлая неделя"),
+    'monthly': ("месяц", "прошлый месяц"),
+}
+
+def _month_start(day, months_back=0):
+    month = day.year * 12 + day.month - 1 - months_back
+    return datetime(month // 12, month % 12 + 1, 1)
+
+def period_bounds(frequency, now):
+    """Границы последнего завершенного периода и предыдущего: (prev_start, start, end)"""
+    today = datetime(now.year, now.month, now.day)
+    if frequency == 'daily':
+        end = today
+        return end - timedelta(days=2), end - timedelta(days=1), end
+    if frequency == 'weekly':
+        end = today - timedelta(days=today.weekday())
+        return end - timedelta(days=14), end - timedelta(days=7), end
+    return _month_start(today, 2), _month_start(today, 1), _month_start(today)
+
+def format_digest(frequency, start, end, net, previous_net, invested):
+    period, previous = FREQUENCIES[frequency]
+    last_day = end - timedelta(days=1)
+    dates = start.strftime('%d.%m.%Y')
+    if last_day > start:
+        dates += f"–{last_day.strftime('%d.%m.%Y')}"
+    return (
+        f"🗓 Сводка за {period} {dates}\n\n"
+        f"💹 Чистый поток: {net:+,.2f} ₽\n"
+        f"↔️ {previous.capitalize()}: {previous_net:+,.2f} ₽ (изменение {net - previous_net:+,.2f} ₽)\n"
+        f"💎 Вложено на конец периода: {invested:,.2f} ₽ ({net:+,.2f} ₽ за период)"
+    )
+
+class DigestScheduler:
+    """Рассылка сводок подписчикам: итоги считаются группирующими запросами по пачкам пользователей"""
+
+    def __init__(self, session_factory, send_queue: SendQueue, interval=DIGEST_CHECK_INTERVAL,
+                 batch_size=DIGEST_BATCH_SIZE, hour=DIGEST_HOUR):
+        self.session_factory = session_factory
+        self.send_queue = send_queue
+        self.interval = interval
+        self.batch_size = batch_size
+        self.hour = hour
+        self._task = None
+
+    def _batch_query(self, frequency, bounds, after):
+        prev_start, start, end = bounds
+        subscribers = select(DigestSubscription.user_id).where(
+            DigestSubscription.frequency == frequency,
+            or_(DigestSubscription.last_sent_at.is_(None), DigestSubscription.last_sent_at < end),
+            DigestSubscription.user_id > after,
+            # Каждый рабочий процесс рассылает сводки только своим пользователям
+            DigestSubscription.user_id % WORKER_COUNT == WORKER_INDEX
+        ).order_by(DigestSubscription.user_id).limit(self.batch_size).subquery()
+
+        signed = case(
+            (P2PTransaction.transaction_type == 'buy', P2PTransaction.amount),
+            (P2PTransaction.transaction_type == 'sell', -P2PTransaction.amount),
+            else_=0.0
+        )
+        return select(
+            subscribers.c.user_id,
+            func.coalesce(func.sum(case((P2PTransaction.date >= start, signed), else_=0.0)), 0.0),
+            func.coalesce(func.sum(case(
+                (and_(P2PTransaction.date >= prev_start, P2PTransaction.date < start), signed), else_=0.0
+            )), 0.0),
+            func.coalesce(func.sum(signed), 0.0),
+        ).select_from(subscribers).outerjoin(P2PTransaction, and_(
+            P2PTransaction.user_id == subscribers.c.user_id,
+            P2PTransaction.date < end
+        )).group_by(subscribers.c.user_id).order_by(subscribers.c.user_id)
+
+    async def send_digests(self, frequency, now=None):
+        """Отправляет сводку за последний завершенный период и возвращает число получателей"""
+        now = now or datetime.now()
+        bounds = period_bounds(frequency, now)
+        _, start, end = bounds
+        after = 0
+        sent = 0
+
+        while True:
+            async with self.session_factory() as session:
+                rows = (await session.execute(self._batch_query(frequency, bounds, after))).all()
+                if not rows:
+                    break
+                user_ids = [row[0] for row in rows]
+                # Отмечаем пачку до отправки, чтобы перезапуск не повторил сводки
+                await session.execute(
+                    update(DigestSubscription)
+                    .where(DigestSubscription.user_id.in_(user_ids))
+                    .values(last_sent_at=now)
+                )
+                await session.commit()
+
+            for user_id, net, previous_net, invested in rows:
+                # Ожидание места в очереди притормаживает расчет следующих пачек
+                await self.send_queue.send(
+                    user_id, format_digest(frequency, start, end, net, previous_net, invested)
+                )
+            sent += len(rows)
+            after = user_ids[-1]
+            if len(rows) < self.batch_size:
+                break
+
+        if sent:
+            logger.info(f"Queued {sent} {frequency} digests")
+        return sent
+
+    def _is_due(self, frequency, now):
+        _, _, end = period_bounds(frequency, now)
+        return now >= end + timedelta(hours=self.hour)
+
+    async def run_periodic(self):
+        while True:
+            now = datetime.now()
+            for frequency in FREQUENCIES:
+                if not self._is_due(frequency, now):
+                    continue
+                try:
+                    await self.send_digests(frequency, now)
+                except Exception as e:
+                    logger.error(f"Failed to send {frequency} digests: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self.run_periodic())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
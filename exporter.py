@@ -0,0 +1,77 @@
+import asyncio
+import csv
+
+from sqlalchemy import select
+
+from models import P2PTransaction
+from config import EXPORT_CHUNK_SIZE
+
+EXPORT_HEADER = ('Дата', 'Тип', 'Сумма, ₽', 'Номер ордера', 'Комментарий')
+TYPE_LABELS = {'buy': 'Пополнение', 'sell': 'Продажа'}
+
+class CsvExportWriter:
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='', encoding='utf-8-sig')
+        self.writer = csv.writer(self.file, delimiter=';')
+        self.writer.writerow(EXPORT_HEADER)
+
+    def write_rows(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+class XlsxExportWriter:
+    def __init__(self, path):
+        from openpyxl import Workbook
+        self.path = path
+        # Write-only книга сбрасывает строки на диск и не держит их в памяти
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet('Транзакции')
+        self.sheet.append(EXPORT_HEADER)
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.sheet.append(row)
+
+    def close(self):
+        self.workbook.save(self.path)
+        self.workbook.close()
+
+EXPORT_WRITERS = {
+    'csv': CsvExportWriter,
+    'xlsx': XlsxExportWriter,
+}
+
+async def export_transactions(session, user_id, path, export_format, chunk_size=EXPORT_CHUNK_SIZE):
+    """Потоково выгружает историю пользователя в файл и возвращает число строк
+
+    Строки читаются серверным курсором порциями по chunk_size,
+    запись в файл выполняется в отдельном потоке.
+    """
+    writer = await asyncio.to_thread(EXPORT_WRITERS[export_format], path)
+    count = 0
+    try:
+        result = await session.stream(
+            select(
+                P2PTransaction.date,
+                P2PTransaction.transaction_type,
+                P2PTransaction.amount,
+                P2PTransaction.external_id,
+                P2PTransaction.comment
+            ).where(
+                P2PTransaction.user_id == user_id
+            ).order_by(
+                P2PTransaction.date, P2PTransaction.id
+            ).execution_options(yield_per=chunk_size)
+        )
+        async for partition in result.partitions():
+            rows = [
+                (date, TYPE_LABELS.get(transaction_type, transaction_type), amount, external_id, comment)
+                for date, transaction_type, amount, external_id, comment in partition
+            ]
+            await asyncio.to_thread(writer.write_rows, rows)
+            count += len(rows)
+    finally:
+        await asyncio.to_thread(writer.close)
+    return count
@@ -1,16 +1,40 @@
-from aiogram import types, F
-from aiogram.filters import CommandStart
+import asyncio
+import os
+import tempfile
+import time
+
+from aiogram import Bot, types, F
+from aiogram.filters import CommandStart, Command, CommandObject, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.types import FSInputFile, BufferedInputFile
+from aiogram.exceptions import TelegramBadRequest
 from datetime import datetime
+from sqlalchemy import select, insert, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from keyboards import (
     get_main_keyboard, get_cancel_keyboard, get_date_keyboard,
     get_transaction_edit_keyboard, get_transaction_type_keyboard,
-    get_transactions_list_keyboard
+    get_transactions_list_keyboard, get_export_format_keyboard,
+    get_analytics_period_keyboard
 )
-from models import P2PTransaction
-from config import logger
+from models import P2PTransaction, BybitAccount, DigestSubscription
+from config import logger, ADMIN_ID, PNL_RATES
+from middlewares import DbSessionMiddleware, UpdateMetricsMiddleware, HandlerMetricsMiddleware
+from metrics import MetricsServer, instrument_engine, watch_stats_cache, watch_send_queue
+from stats import get_user_statistics, stats_cache
+from importer import import_orders, ImportFormatError
+from exporter import export_transactions
+from bybit_sync import BybitSync
+from sender import SendQueue, DeliveryCounter
+from write_queue import WriteBatcher
+from ledger import record_change, added, removed, balance_at, get_balance
+from analytics import load_daily_frame, summarize
+from charts import ChartRenderer
+from digests import DigestScheduler, FREQUENCIES
+from pnl import PnLEngine, FixedRateSource, price_for
+from quick_entry import parse_quick_entries, QUICK_ENTRY_PATTERN
 
 class TransactionStates(StatesGroup):
     waiting_for_amount = State()
@@ -20,34 +44,192 @@ class TransactionStates(StatesGroup):
     editing_date = State()
     editing_type = State()
 
-async def register_handlers(dp, db_session):
+TRANSACTIONS_PAGE_SIZE = 10
+IMPORT_PROGRESS_INTERVAL = 1.0  # seconds between status message edits
+BROADCAST_PAGE_SIZE = 1000
+
+async def get_transactions_page(session, user_id, cursor=None, direction='next'):
+    """Возвращает страницу транзакций (от новых к старым) по ключу (date, id)
+    
+    Результат: (transactions, has_prev, has_next)
+    """
+    query = select(P2PTransaction).filter_by(user_id=user_id)
+    
+    if cursor is not None and direction == 'prev':
+        date, transaction_id = cursor
+        query = query.where(or_(
+            P2PTransaction.date > date,
+            and_(P2PTransaction.date == date, P2PTransaction.id > transaction_id)
+        )).order_by(P2PTransaction.date.asc(), P2PTransaction.id.asc())
+    else:
+        if cursor is not None:
+            date, transaction_id = cursor
+            query = query.where(or_(
+                P2PTransaction.date < date,
+                and_(P2PTransaction.date == date, P2PTransaction.id < transaction_id)
+            ))
+        query = query.order_by(P2PTransaction.date.desc(), P2PTransaction.id.desc())
+    
+    # Берем на одну запись больше, чтобы понять, есть ли следующая страница
+    transactions = list((await session.execute(
+        query.limit(TRANSACTIONS_PAGE_SIZE + 1)
+    )).scalars().all())
+    has_more = len(transactions) > TRANSACTIONS_PAGE_SIZE
+    transactions = transactions[:TRANSACTIONS_PAGE_SIZE]
+    
+    if cursor is not None and direction == 'prev':
+        transactions.reverse()
+        return transactions, has_more, True
+    return transactions, cursor is not None, has_more
+
+async def update_transaction(write_batcher, transaction_id, **values):
+    """Изменяет поля транзакции групповым коммитом и возвращает ее владельца"""
+    async def apply(session):
+        transaction = await session.get(P2PTransaction, transaction_id)
+        if transaction is None:
+            return None
+        old = removed(transaction.transaction_type, transaction.amount, transaction.date)
+        details = {}
+        for field, value in values.items():
+            details[field] = [getattr(transaction, field), value]
+            setattr(transaction, field, value)
+        if 'amount' in values and transaction.quantity:
+            # Количество актива не меняется - цена следует за новой суммой,
+            # чтобы /pnl сходился с остатком и статистикой
+            price = price_for(transaction.amount, transaction.quantity)
+            details['price'] = [transaction.price, price]
+            transaction.price = price
+        new = added(transaction.transaction_type, transaction.amount, transaction.date)
+        await record_change(session, transaction.user_id, 'edit', [old, new], transaction.id, details)
+        return transaction.user_id
+    
+    return await write_batcher.submit(apply)
+
+PERIOD_TITLES = {'day': "по дням", 'week': "по неделям", 'month': "по месяцам"}
+
+def format_period(period, kind):
+    start = period.start_time
+    if kind == 'month':
+        return start.strftime('%m.%Y')
+    if kind == 'week':
+        return f"нед. с {start.strftime('%d.%m.%Y')}"
+    return start.strftime('%d.%m.%Y')
+
+async def build_analytics_text(session, user_id, kind):
+    daily = await load_daily_frame(session, user_id)
+    # Расчет на pandas выполняется вне event loop
+    summary = await asyncio.to_thread(summarize, daily, kind)
+    if not summary['count']:
+        return "📭 У вас пока нет транзакций для аналитики."
+    
+    lines = [f"🧮 Аналитика {PERIOD_TITLES[kind]} (последние {len(summary['periods'])}):\n"]
+    for period, row in summary['periods'].iterrows():
+        lines.append(
+            f"• {format_period(period, kind)}: поток {row['net']:+,.2f} ₽, "
+            f"вложено {row['invested']:,.2f} ₽, ср. чек {row['avg_ticket']:,.2f} ₽"
+        )
+    lines.append(f"\n🎫 Средний чек за все время: {summary['avg_ticket']:,.2f} ₽")
+    return "\n".join(lines)
+
+async def register_handlers(dp, session_factory):
+    # Каждый апдейт получает собственную сессию из пула
+    dp.update.middleware(DbSessionMiddleware(session_factory))
+    
+    # Записи из хендлеров объединяются в групповые коммиты
+    write_batcher = WriteBatcher(session_factory)
+    dp['write_batcher'] = write_batcher
+    dp.startup.register(write_batcher.start)
+    
+    # Синхронизация с Bybit доступна хендлерам как bybit_sync
+    bybit_sync = BybitSync(session_factory, write_batcher)
+    dp['bybit_sync'] = bybit_sync
+    dp.startup.register(bybit_sync.start)
+    dp.shutdown.register(bybit_sync.stop)
+    # Батчер останавливается после синхронизации, которая через него пишет
+    dp.shutdown.register(write_batcher.stop)
+    
+    # Исходящие сообщения с ограничением частоты доступны как send_queue
+    send_queue = SendQueue()
+    dp['send_queue'] = send_queue
+    dp.startup.register(send_queue.start)
+    dp.shutdown.register(send_queue.stop)
+    
+    # Сводки подписчикам уходят через общую очередь отправки
+    digest_scheduler = DigestScheduler(session_factory, send_queue)
+    dp.startup.register(digest_scheduler.start)
+    dp.shutdown.register(digest_scheduler.stop)
+    
+    # Курсы для оценки позиций задаются в настройках, иначе берется цена последней сделки
+    dp['pnl_engine'] = PnLEngine(FixedRateSource(PNL_RATES))
+    
+    # Графики рисуются в пуле процессов, готовые переиспользуются по file_id
+    chart_renderer = ChartRenderer()
+    dp['chart_renderer'] = chart_renderer
+    dp.startup.register(chart_renderer.start)
+    dp.shutdown.register(chart_renderer.stop)
+    
+    # Метрики Prometheus: апдейты и SQL на уровне update, время и ошибки - по хендлерам
+    instrument_engine(session_factory.kw['bind'].sync_engine)
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    dp.message.middleware(HandlerMetricsMiddleware())
+    dp.callback_query.middleware(HandlerMetricsMiddleware())
+    watch_stats_cache(stats_cache)
+    watch_send_queue(send_queue)
+    metrics_server = MetricsServer()
+    dp.startup.register(metrics_server.start)
+    dp.shutdown.register(metrics_server.stop)
+    
+    broadcast_tasks = set()
+    
+    async def run_broadcast(text, admin_chat_id):
+        counter = DeliveryCounter()
+        recipients = 0
+        last_user_id = None
+        while True:
+            # Получателей читаем страницами, не держа соединение на время рассылки
+            query = select(P2PTransaction.user_id).distinct().order_by(P2PTransaction.user_id)
+            if last_user_id is not None:
+                query = query.where(P2PTransaction.user_id > last_user_id)
+            async with session_factory() as session:
+                user_ids = (await session.execute(query.limit(BROADCAST_PAGE_SIZE))).scalars().all()
+            if not user_ids:
+                break
+            for user_id in user_ids:
+                await send_queue.send(user_id, text, counter=counter)
+            recipients += len(user_ids)
+            last_user_id = user_ids[-1]
+        
+        # Ждем только свои сообщения: сводки и ответы других хендлеров не в счет
+        await counter.wait()
+        await send_queue.send(
+            admin_chat_id,
+            "📣 Рассылка завершена\n"
+            f"Получателей: {recipients}\n"
+            f"Доставлено: {counter.sent}\n"
+            f"Ошибок: {counter.failed}"
+        )
     
     @dp.message(CommandStart())
     async def send_welcome(message: types.Message):
         keyboard = get_main_keyboard()
         await message.reply(
             "👋 Привет! Я помогу тебе отслеживать твои P2P транзакции на Bybit.\n\n"
-            "Используй кнопки ниже для управления:",
+            "Используй кнопки ниже для управления.\n\n"
+            "⚡ Быстрый ввод: отправь «+5000 25.02.2024» для пополнения или «-1200» для продажи. "
+            "Можно прислать сразу несколько строк.",
             reply_markup=keyboard
         )
 
     @dp.message(F.text == "📊 Статистика")
-    async def show_statistics(message: types.Message):
+    async def show_statistics(message: types.Message, session: AsyncSession):
         user_id = message.from_user.id
         
-        # Get all transactions for the user
-        buys = db_session.query(P2PTransaction).filter_by(
-            user_id=user_id,
-            transaction_type='buy'
-        ).order_by(P2PTransaction.date.desc()).all()
-        
-        sells = db_session.query(P2PTransaction).filter_by(
-            user_id=user_id,
-            transaction_type='sell'
-        ).order_by(P2PTransaction.date.desc()).all()
+        user_stats = await get_user_statistics(session, user_id)
+        buys = user_stats['buy']
+        sells = user_stats['sell']
         
-        total_bought = sum(t.amount for t in buys)
-        total_sold = sum(t.amount for t in sells)
+        total_bought = buys['total']
+        total_sold = sells['total']
         invested_amount = total_bought - total_sold
         
         # Формируем основную статистику
@@ -55,26 +237,158 @@ async def register_handlers(dp, db_session):
             "📊 Статистика ваших P2P транзакций:\n",
             f"💎 Текущие инвестиции: {invested_amount:,.2f} ₽\n",
             f"💰 Всего внесено: {total_bought:,.2f} ₽",
-            f"📈 Всего покупок: {len(buys)}",
+            f"📈 Всего покупок: {buys['count']}",
             f"💸 Всего продано: {total_sold:,.2f} ₽",
-            f"📉 Всего продаж: {len(sells)}\n"
+            f"📉 Всего продаж: {sells['count']}\n"
         ]
         
         # Добавляем последние 5 пополнений
-        if buys:
+        if buys['last']:
             stats.append("\n🔵 Последние пополнения:")
-            for t in buys[:5]:
-                stats.append(f"• {t.date.strftime('%d.%m.%Y')}: {t.amount:,.2f} ₽")
+            for date, amount in buys['last']:
+                stats.append(f"• {date.strftime('%d.%m.%Y')}: {amount:,.2f} ₽")
         
         # Добавляем последние 5 продаж
-        if sells:
+        if sells['last']:
             stats.append("\n🔴 Последние продажи:")
-            for t in sells[:5]:
-                stats.append(f"• {t.date.strftime('%d.%m.%Y')}: {t.amount:,.2f} ₽")
+            for date, amount in sells['last']:
+                stats.append(f"• {date.strftime('%d.%m.%Y')}: {amount:,.2f} ₽")
         
         keyboard = get_main_keyboard()
         await message.reply("\n".join(stats), reply_markup=keyboard)
 
+    @dp.message(Command("balance"))
+    async def show_balance(message: types.Message, command: CommandObject, session: AsyncSession):
+        user_id = message.from_user.id
+        if command.args:
+            try:
+                day = datetime.strptime(command.args.strip(), "%d.%m.%Y")
+            except ValueError:
+                await message.reply("Использование: /balance или /balance ДД.ММ.ГГГГ")
+                return
+            totals = await balance_at(session, user_id, day.date())
+            title = f"на конец {day.strftime('%d.%m.%Y')}"
+        else:
+            balance = await get_balance(session, user_id)
+            totals = {
+                'buy_total': balance.buy_total if balance else 0.0,
+                'sell_total': balance.sell_total if balance else 0.0,
+            }
+            title = "сейчас"
+        
+        invested = totals['buy_total'] - totals['sell_total']
+        await message.reply(
+            f"💎 Вложено {title}: {invested:,.2f} ₽\n"
+            f"💰 Внесено: {totals['buy_total']:,.2f} ₽\n"
+            f"💸 Продано: {totals['sell_total']:,.2f} ₽",
+            reply_markup=get_main_keyboard()
+        )
+
+    @dp.message(F.text == "🧮 Аналитика")
+    async def show_analytics(message: types.Message, session: AsyncSession):
+        text = await build_analytics_text(session, message.from_user.id, 'month')
+        await message.reply(text, reply_markup=get_analytics_period_keyboard('month'))
+
+    @dp.callback_query(F.data.in_({'analytics_day', 'analytics_week', 'analytics_month'}))
+    async def switch_analytics_period(callback: types.CallbackQuery, session: AsyncSession):
+        kind = callback.data.split('_', 1)[1]
+        text = await build_analytics_text(session, callback.from_user.id, kind)
+        try:
+            await callback.message.edit_text(text, reply_markup=get_analytics_period_keyboard(kind))
+        except TelegramBadRequest:
+            # Текст не изменился - Telegram отклоняет такое редактирование
+            pass
+        await callback.answer()
+
+    @dp.message(F.text == "📈 График")
+    async def show_chart(message: types.Message, session: AsyncSession, chart_renderer: ChartRenderer):
+        user_id = message.from_user.id
+        # Каждая запись добавляет строку журнала, поэтому ее id - версия данных
+        balance = await get_balance(session, user_id)
+        version = balance.last_entry_id if balance else 0
+        
+        file_id = chart_renderer.cached_file_id(user_id, version)
+        if file_id is not None:
+            await message.answer_photo(file_id, reply_markup=get_main_keyboard())
+            return
+        
+        daily = await load_daily_frame(session, user_id)
+        if daily.empty:
+            await message.reply("📭 У вас пока нет транзакций для графика.")
+            return
+        
+        try:
+            png = await chart_renderer.render(user_id, version, daily)
+        except Exception as e:
+            logger.error(f"Error rendering chart: {e}")
+            await message.reply("❌ Не удалось построить график. Попробуйте позже.")
+            return
+        sent = await message.answer_photo(
+            BufferedInputFile(png, filename='chart.png'),
+            reply_markup=get_main_keyboard()
+        )
+        chart_renderer.remember(user_id, version, sent.photo[-1].file_id)
+
+    @dp.message(Command("pnl"))
+    async def show_pnl(message: types.Message, session: AsyncSession, pnl_engine: PnLEngine):
+        report = await pnl_engine.report(session, message.from_user.id)
+        if not report:
+            await message.reply(
+                "📭 Нет транзакций с количеством актива.\n"
+                "Количество и цена сохраняются при импорте и синхронизации с Bybit.",
+                reply_markup=get_main_keyboard()
+            )
+            return
+        
+        lines = ["💹 Прибыль по FIFO:\n"]
+        for asset, position in report.items():
+            rate_note = " (цена последней сделки)" if position['rate_is_last_trade'] else ""
+            lines.append(
+                f"🪙 {asset}\n"
+                f"Реализованная: {position['realized']:+,.2f} ₽\n"
+                f"Нереализованная: {position['unrealized']:+,.2f} ₽\n"
+                f"Остаток: {position['remaining']:,.6f} {asset} на {position['cost']:,.2f} ₽\n"
+                f"Курс: {position['rate']:,.2f} ₽{rate_note}"
+            )
+            if position['unmatched']:
+                lines.append(f"⚠️ Продано без покупок в истории: {position['unmatched']:,.6f} {asset}")
+            lines.append("")
+        await message.reply("\n".join(lines).rstrip(), reply_markup=get_main_keyboard())
+
+    @dp.message(Command("cache"), F.from_user.id == ADMIN_ID)
+    async def show_cache_info(message: types.Message):
+        info = stats_cache.info()
+        await message.reply(
+            "🗄 Кэш статистики:\n"
+            f"Записей: {info['size']} из {info['max_entries']}\n"
+            f"Попаданий: {info['hits']}\n"
+            f"Промахов: {info['misses']}\n"
+            f"Вытеснено: {info['evictions']}"
+        )
+
+    @dp.message(Command("broadcast"), F.from_user.id == ADMIN_ID)
+    async def start_broadcast(message: types.Message, command: CommandObject):
+        if not command.args:
+            await message.reply("Использование: /broadcast текст сообщения")
+            return
+        
+        task = asyncio.create_task(run_broadcast(command.args, message.chat.id))
+        broadcast_tasks.add(task)
+        task.add_done_callback(broadcast_tasks.discard)
+        await message.reply("📣 Рассылка запущена. Пришлю итог, когда она завершится.")
+
+    @dp.message(Command("queue"), F.from_user.id == ADMIN_ID)
+    async def show_queue_info(message: types.Message, send_queue: SendQueue):
+        info = send_queue.info()
+        await message.reply(
+            "📬 Очередь отправки:\n"
+            f"В очереди: {info['queued']} из {info['max_size']}\n"
+            f"Отправлено: {info['sent']}\n"
+            f"Ошибок: {info['failed']}\n"
+            f"Отброшено: {info['dropped']}\n"
+            f"Повторов после RetryAfter: {info['retried']}"
+        )
+
     @dp.message(F.text == "💰 Добавить пополнение")
     async def start_add_deposit(message: types.Message, state: FSMContext):
         await state.set_state(TransactionStates.waiting_for_amount)
@@ -106,6 +420,56 @@ async def register_handlers(dp, db_session):
             reply_markup=keyboard
         )
 
+    @dp.message(StateFilter(None), F.text.regexp(QUICK_ENTRY_PATTERN))
+    async def quick_add(message: types.Message, write_batcher: WriteBatcher):
+        entries, errors = parse_quick_entries(message.text)
+        if errors:
+            lines = ", ".join(str(number) for number in errors[:10])
+            await message.reply(
+                f"❌ Не удалось разобрать строки: {lines}\n"
+                "Формат: +5000 25.02.2024 (пополнение) или -1200 (продажа, дата - сегодня).\n"
+                "Ничего не сохранено.",
+                reply_markup=get_main_keyboard()
+            )
+            return
+        
+        user_id = message.from_user.id
+        rows = [dict(entry, user_id=user_id) for entry in entries]
+        
+        async def save(session):
+            await session.execute(insert(P2PTransaction), rows)
+            await record_change(session, user_id, 'add', [
+                added(row['transaction_type'], row['amount'], row['date']) for row in rows
+            ])
+        
+        try:
+            await write_batcher.submit(save)
+        except Exception as e:
+            logger.error(f"Error saving quick entries: {e}")
+            await message.reply(
+                "❌ Произошла ошибка. Попробуйте снова.",
+                reply_markup=get_main_keyboard()
+            )
+            return
+        stats_cache.invalidate(user_id)
+        
+        if len(entries) == 1:
+            entry = entries[0]
+            action_type = "пополнение" if entry['transaction_type'] == 'buy' else "продажа"
+            text = (
+                f"✅ {action_type.capitalize()} на сумму {entry['amount']:,.2f} ₽ "
+                f"от {entry['date'].strftime('%d.%m.%Y')} успешно сохранено!"
+            )
+        else:
+            bought = sum(e['amount'] for e in entries if e['transaction_type'] == 'buy')
+            sold = sum(e['amount'] for e in entries if e['transaction_type'] == 'sell')
+            text = (
+                f"✅ Сохранено транзакций: {len(entries)}\n"
+                f"💰 Пополнения: {bought:,.2f} ₽\n"
+                f"💸 Продажи: {sold:,.2f} ₽"
+            )
+        await message.reply(text, reply_markup=get_main_keyboard())
+
     @dp.message(TransactionStates.waiting_for_amount)
     async def process_amount(message: types.Message, state: FSMContext):
         try:
@@ -132,7 +496,7 @@ async def register_handlers(dp, db_session):
             )
 
     @dp.message(TransactionStates.waiting_for_date)
-    async def process_date(message: types.Message, state: FSMContext):
+    async def process_date(message: types.Message, state: FSMContext, write_batcher: WriteBatcher):
         try:
             # Get saved data
             state_data = await state.get_data()
@@ -154,15 +518,25 @@ async def register_handlers(dp, db_session):
                     )
                     return
             
-            # Create and save transaction
-            transaction = P2PTransaction(
-                user_id=message.from_user.id,
-                amount=amount,
-                transaction_type=transaction_type,
-                date=date
-            )
-            db_session.add(transaction)
-            db_session.commit()
+            # Create and save transaction; reply only after the batch is committed
+            user_id = message.from_user.id
+            
+            async def save(session):
+                transaction = P2PTransaction(
+                    user_id=user_id,
+                    amount=amount,
+                    transaction_type=transaction_type,
+                    date=date
+                )
+                session.add(transaction)
+                await session.flush()
+                await record_change(
+                    session, user_id, 'add',
+                    [added(transaction_type, amount, date)], transaction.id
+                )
+            
+            await write_batcher.submit(save)
+            stats_cache.invalidate(user_id)
             
             await state.clear()
             
@@ -183,14 +557,207 @@ async def register_handlers(dp, db_session):
             )
             await state.clear()
 
+    @dp.message(F.text == "📥 Импорт из Bybit")
+    async def show_import_help(message: types.Message):
+        await message.reply(
+            "📥 Отправьте файл с историей ордеров Bybit P2P (.csv или .xlsx).\n\n"
+            "Учитываются только завершенные ордера, уже загруженные ордера пропускаются.",
+            reply_markup=get_main_keyboard()
+        )
+
+    @dp.message(F.document)
+    async def import_document(message: types.Message, bot: Bot, write_batcher: WriteBatcher):
+        file_name = message.document.file_name or ""
+        extension = os.path.splitext(file_name)[1].lower()
+        if extension not in ('.csv', '.xlsx'):
+            await message.reply(
+                "❌ Поддерживаются только файлы .csv и .xlsx.",
+                reply_markup=get_main_keyboard()
+            )
+            return
+        
+        user_id = message.from_user.id
+        status = await message.reply("⏳ Загружаю файл...")
+        last_update = time.monotonic()
+        
+        async def report_progress(result):
+            nonlocal last_update
+            if time.monotonic() - last_update < IMPORT_PROGRESS_INTERVAL:
+                return
+            last_update = time.monotonic()
+            await status.edit_text(
+                f"⏳ Обработано строк: {result['processed']}\n"
+                f"Добавлено: {result['imported']}"
+            )
+        
+        try:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                path = os.path.join(tmp_dir, f"orders{extension}")
+                await bot.download(message.document, destination=path)
+                result = await import_orders(write_batcher, user_id, path, report_progress)
+        except ImportFormatError as e:
+            await status.edit_text(f"❌ Не удалось разобрать файл. {e}")
+            return
+        except Exception as e:
+            logger.error(f"Error importing orders: {e}")
+            # Сохраненные части останутся; повторный импорт пропустит их как дубликаты
+            stats_cache.invalidate(user_id)
+            await status.edit_text("❌ Произошла ошибка при импорте. Попробуйте снова.")
+            return
+        
+        stats_cache.invalidate(user_id)
+        await status.edit_text(
+            "✅ Импорт завершен!\n\n"
+            f"Обработано строк: {result['processed']}\n"
+            f"Добавлено транзакций: {result['imported']}\n"
+            f"Пропущено дубликатов: {result['duplicates']}\n"
+            f"Пропущено некорректных строк: {result['rejected']}"
+        )
+
+    @dp.message(Command("bybit"))
+    async def connect_bybit(message: types.Message, command: CommandObject, session: AsyncSession):
+        args = (command.args or "").split()
+        # Сообщение содержит секретный ключ - удаляем его из чата
+        try:
+            await message.delete()
+        except Exception as e:
+            logger.error(f"Failed to delete message with API keys: {e}")
+        
+        if len(args) != 2:
+            await message.answer(
+                "Чтобы подключить синхронизацию, отправьте:\n"
+                "/bybit API_KEY API_SECRET\n\n"
+                "Используйте ключ только с правами на чтение.",
+                reply_markup=get_main_keyboard()
+            )
+            return
+        
+        api_key, api_secret = args
+        account = await session.get(BybitAccount, message.from_user.id)
+        if account is None:
+            account = BybitAccount(user_id=message.from_user.id)
+            session.add(account)
+        account.api_key = api_key
+        account.api_secret = api_secret
+        account.sync_enabled = True
+        await session.commit()
+        
+        await message.answer(
+            "✅ Аккаунт Bybit подключен. Ордера будут синхронизироваться автоматически.",
+            reply_markup=get_main_keyboard()
+        )
+
+    @dp.message(Command("bybit_off"))
+    async def disconnect_bybit(message: types.Message, session: AsyncSession):
+        account = await session.get(BybitAccount, message.from_user.id)
+        if account is not None:
+            account.sync_enabled = False
+            await session.commit()
+        await message.reply(
+            "Синхронизация с Bybit отключена.",
+            reply_markup=get_main_keyboard()
+        )
+
+    @dp.message(Command("digest"))
+    async def set_digest(message: types.Message, command: CommandObject, session: AsyncSession):
+        frequency = (command.args or "").strip().lower()
+        subscription = await session.get(DigestSubscription, message.from_user.id)
+        
+        if frequency == 'off':
+            if subscription is not None:
+                await session.delete(subscription)
+                await session.commit()
+            await message.reply("Сводки отключены.", reply_markup=get_main_keyboard())
+            return
+        
+        if frequency not in FREQUENCIES:
+            current = f"Сейчас: {subscription.frequency}\n\n" if subscription else ""
+            await message.reply(
+                f"{current}Подписка на сводку по вашим транзакциям:\n"
+                "/digest daily - каждый день\n"
+                "/digest weekly - каждую неделю\n"
+                "/digest monthly - каждый месяц\n"
+                "/digest off - отключить",
+                reply_markup=get_main_keyboard()
+            )
+            return
+        
+        if subscription is None:
+            subscription = DigestSubscription(user_id=message.from_user.id)
+            session.add(subscription)
+        subscription.frequency = frequency
+        # Первая сводка придет за следующий завершенный период
+        subscription.last_sent_at = datetime.now()
+        await session.commit()
+        await message.reply(
+            f"✅ Сводка будет приходить раз в {FREQUENCIES[frequency][0]}.",
+            reply_markup=get_main_keyboard()
+        )
+
+    @dp.message(F.text == "🔄 Синхронизация с Bybit")
+    async def sync_bybit(message: types.Message, bybit_sync: BybitSync, session: AsyncSession):
+        account = await session.get(BybitAccount, message.from_user.id)
+        if account is None or not account.sync_enabled:
+            await message.reply(
+                "Синхронизация не подключена. Отправьте:\n"
+                "/bybit API_KEY API_SECRET",
+                reply_markup=get_main_keyboard()
+            )
+            return
+        
+        status = await message.reply("⏳ Загружаю ордера с Bybit...")
+        try:
+            imported = await bybit_sync.sync_user(message.from_user.id)
+        except Exception as e:
+            logger.error(f"Error syncing Bybit orders: {e}")
+            await status.edit_text("❌ Не удалось получить ордера с Bybit. Проверьте API ключи.")
+            return
+        
+        await status.edit_text(f"✅ Синхронизация завершена. Новых ордеров: {imported}")
+
+    @dp.message(F.text == "📤 Экспорт")
+    async def choose_export_format(message: types.Message):
+        await message.reply(
+            "Выберите формат файла для экспорта:",
+            reply_markup=get_export_format_keyboard()
+        )
+
+    @dp.callback_query(F.data.startswith('export_'))
+    async def export_history(callback_query: types.CallbackQuery, session: AsyncSession):
+        export_format = callback_query.data.split('_')[1]
+        await callback_query.answer("⏳ Готовлю файл...")
+        
+        try:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                path = os.path.join(tmp_dir, f"p2p_transactions.{export_format}")
+                count = await export_transactions(
+                    session, callback_query.from_user.id, path, export_format
+                )
+                if not count:
+                    await callback_query.message.answer(
+                        "У вас пока нет транзакций для экспорта.",
+                        reply_markup=get_main_keyboard()
+                    )
+                    return
+                
+                await callback_query.message.answer_document(
+                    FSInputFile(path),
+                    caption=f"📤 Экспортировано транзакций: {count}",
+                    reply_markup=get_main_keyboard()
+                )
+        except Exception as e:
+            logger.error(f"Error exporting transactions: {e}")
+            await callback_query.message.answer(
+                "❌ Произошла ошибка при экспорте. Попробуйте снова.",
+                reply_markup=get_main_keyboard()
+            )
+
     @dp.message(F.text == "📝 Редактировать транзакции")
-    async def show_transactions_for_edit(message: types.Message):
+    async def show_transactions_for_edit(message: types.Message, session: AsyncSession):
         user_id = message.from_user.id
         
-        # Get all transactions for the user
-        transactions = db_session.query(P2PTransaction).filter_by(
-            user_id=user_id
-        ).order_by(P2PTransaction.date.desc()).all()
+        # Get the first page of transactions for the user
+        transactions, has_prev, has_next = await get_transactions_page(session, user_id)
         
         if not transactions:
             await message.reply(
@@ -199,18 +766,32 @@ async def register_handlers(dp, db_session):
             )
             return
         
-        keyboard = get_transactions_list_keyboard(transactions)
+        keyboard = get_transactions_list_keyboard(transactions, has_prev, has_next)
         await message.reply(
             "Выберите транзакцию для редактирования:",
             reply_markup=keyboard
         )
 
+    @dp.callback_query(F.data.startswith('txpage_'))
+    async def paginate_transactions(callback_query: types.CallbackQuery, session: AsyncSession):
+        _, direction, date, transaction_id = callback_query.data.split('_')
+        cursor = (datetime.fromisoformat(date), int(transaction_id))
+        
+        # Fetch only the requested page and update the keyboard in place
+        transactions, has_prev, has_next = await get_transactions_page(
+            session, callback_query.from_user.id, cursor, direction
+        )
+        if transactions:
+            keyboard = get_transactions_list_keyboard(transactions, has_prev, has_next)
+            await callback_query.message.edit_reply_markup(reply_markup=keyboard)
+        await callback_query.answer()
+
     @dp.callback_query(lambda c: c.data.startswith('edit_'))
-    async def edit_transaction(callback_query: types.CallbackQuery, state: FSMContext):
+    async def edit_transaction(callback_query: types.CallbackQuery, state: FSMContext, session: AsyncSession):
         transaction_id = int(callback_query.data.split('_')[1])
         
         # Get transaction
-        transaction = db_session.query(P2PTransaction).filter_by(id=transaction_id).first()
+        transaction = await session.get(P2PTransaction, transaction_id)
         if not transaction:
             await callback_query.message.reply(
                 "❌ Транзакция не найдена.",
@@ -273,7 +854,7 @@ async def register_handlers(dp, db_session):
         )
 
     @dp.message(TransactionStates.editing_amount)
-    async def process_edit_amount(message: types.Message, state: FSMContext):
+    async def process_edit_amount(message: types.Message, state: FSMContext, write_batcher: WriteBatcher):
         try:
             amount = float(message.text.replace(',', '.'))
             if amount <= 0:
@@ -284,10 +865,9 @@ async def register_handlers(dp, db_session):
             transaction_id = state_data.get('editing_transaction_id')
             
             # Update transaction
-            transaction = db_session.query(P2PTransaction).filter_by(id=transaction_id).first()
-            if transaction:
-                transaction.amount = amount
-                db_session.commit()
+            owner_id = await update_transaction(write_batcher, transaction_id, amount=amount)
+            if owner_id is not None:
+                stats_cache.invalidate(owner_id)
                 
                 await state.clear()
                 keyboard = get_main_keyboard()
@@ -314,7 +894,7 @@ async def register_handlers(dp, db_session):
             await state.clear()
 
     @dp.message(TransactionStates.editing_date)
-    async def process_edit_date(message: types.Message, state: FSMContext):
+    async def process_edit_date(message: types.Message, state: FSMContext, write_batcher: WriteBatcher):
         try:
             # Get transaction id from state
             state_data = await state.get_data()
@@ -336,10 +916,9 @@ async def register_handlers(dp, db_session):
                     return
             
             # Update transaction
-            transaction = db_session.query(P2PTransaction).filter_by(id=transaction_id).first()
-            if transaction:
-                transaction.date = date
-                db_session.commit()
+            owner_id = await update_transaction(write_batcher, transaction_id, date=date)
+            if owner_id is not None:
+                stats_cache.invalidate(owner_id)
                 
                 await state.clear()
                 keyboard = get_main_keyboard()
@@ -360,7 +939,7 @@ async def register_handlers(dp, db_session):
             await state.clear()
 
     @dp.message(TransactionStates.editing_type)
-    async def process_edit_type(message: types.Message, state: FSMContext):
+    async def process_edit_type(message: types.Message, state: FSMContext, write_batcher: WriteBatcher):
         try:
             # Get transaction id from state
             state_data = await state.get_data()
@@ -379,10 +958,9 @@ async def register_handlers(dp, db_session):
                 return
             
             # Update transaction
-            transaction = db_session.query(P2PTransaction).filter_by(id=transaction_id).first()
-            if transaction:
-                transaction.transaction_type = new_type
-                db_session.commit()
+            owner_id = await update_transaction(write_batcher, transaction_id, transaction_type=new_type)
+            if owner_id is not None:
+                stats_cache.invalidate(owner_id)
                 
                 await state.clear()
                 keyboard = get_main_keyboard()
@@ -0,0 +1,226 @@
+import asyncio
+
+from sqlalchemy import select, insert
+
+from models import P2PTransaction
+from ledger import record_change, added
+from pnl import QUANTITY_SCALE, PRICE_SCALE
+from config import IMPORT_CHUNK_SIZE
+
+# Возможные названия колонок в выгрузке ордеров Bybit P2P
+COLUMN_ALIASES = {
+    'order_id': ('order no.', 'order no', 'order number', 'order id', 'номер ордера'),
+    'side': ('type', 'side', 'order type', 'тип'),
+    'amount': ('fiat amount', 'total amount', 'amount', 'сумма', 'сумма, ₽'),
+    'date': ('time', 'create time', 'created time', 'order time', 'date', 'время', 'дата'),
+    'status': ('status', 'статус'),
+    'asset': ('coin', 'cryptocurrency', 'token', 'asset', 'монета'),
+    'quantity': ('quantity', 'coin amount', 'crypto amount', 'количество'),
+    'price': ('price', 'unit price', 'цена'),
+}
+REQUIRED_COLUMNS = ('side', 'amount', 'date')
+
+DEFAULT_ASSET = 'USDT'
+SIDES = {'buy': 'buy', 'покупка': 'buy', 'пополнение': 'buy', 'sell': 'sell', 'продажа': 'sell'}
+# Форматы дат выгрузок: день всегда раньше месяца, если год не стоит первым
+DATE_FORMATS = (
+    '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d',
+    '%d.%m.%Y %H:%M:%S', '%d.%m.%Y %H:%M', '%d.%m.%Y',
+    '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d/%m/%Y',
+)
+CSV_SEPARATORS = (',', ';', '\t')
+# Запятая - разделитель тысяч только в записи вида 1,234,567.89
+THOUSANDS_COMMA_PATTERN = r'^[1-9]\d{0,2}(?:,\d{3})+(?:\.\d+)?$'
+COMPLETED_STATUSES = {'completed', 'завершено', 'завершен'}
+
+class ImportFormatError(ValueError):
+    pass
+
+def resolve_columns(columns):
+    """Сопоставляет колонки файла с полями транзакции"""
+    normalized = {str(column).strip().lower(): column for column in columns}
+    mapping = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in normalized:
+                mapping[field] = normalized[alias]
+                break
+
+    missing = [field for field in REQUIRED_COLUMNS if field not in mapping]
+    if missing:
+        raise ImportFormatError(
+            "Не найдены колонки: " + ", ".join(COLUMN_ALIASES[field][0] for field in missing)
+        )
+    return mapping
+
+def detect_separator(path):
+    """Разделитель CSV по строке заголовка: ',' у Bybit, ';' у exporter.py и Excel"""
+    with open(path, encoding='utf-8-sig', errors='replace') as f:
+        header = f.readline()
+    return max(CSV_SEPARATORS, key=header.count)
+
+def iter_frames(path, chunk_size):
+    """Читает файл частями, не загружая его в память целиком"""
+    # pandas и openpyxl загружаются при первом импорте, а не при старте бота
+    import pandas as pd
+    if path.lower().endswith('.csv'):
+        yield from pd.read_csv(
+            path, chunksize=chunk_size, dtype=str, sep=detect_separator(path), encoding='utf-8-sig'
+        )
+        return
+
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield pd.DataFrame.from_records(chunk, columns=header)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame.from_records(chunk, columns=header)
+    finally:
+        workbook.close()
+
+def to_numbers(column):
+    """Числа в записи '9250.50', '9 250,50', '1.234,56' или '1,234.56'"""
+    import pandas as pd
+    text = column.astype(str).str.replace(r'\s', '', regex=True)
+    thousands = text.str.match(THOUSANDS_COMMA_PATTERN)
+    # Иначе запятая десятичная, а точки перед ней - разделители тысяч
+    decimal_comma = text.str.contains(',', regex=False) & ~thousands
+    text = text.where(~thousands, text.str.replace(',', '', regex=False))
+    text = text.where(~decimal_comma, text.str.replace('.', '', regex=False).str.replace(',', '.', regex=False))
+    return pd.to_numeric(text, errors='coerce')
+
+def to_dates(column):
+    """Даты по списку DATE_FORMATS, без угадывания порядка дня и месяца"""
+    import pandas as pd
+    text = column.astype(str).str.strip()
+    dates = pd.Series(pd.NaT, index=column.index, dtype='datetime64[ns]')
+    for date_format in DATE_FORMATS:
+        missing = dates.isna()
+        if not missing.any():
+            break
+        dates[missing] = pd.to_datetime(text[missing], format=date_format, errors='coerce')
+    return dates
+
+def normalize_frame(frame, mapping):
+    """Приводит часть выгрузки к строкам P2PTransaction, отбрасывая некорректные"""
+    import pandas as pd
+    rows = pd.DataFrame({
+        'transaction_type': frame[mapping['side']].astype(str).str.strip().str.lower().map(SIDES),
+        'amount': to_numbers(frame[mapping['amount']]),
+        'date': to_dates(frame[mapping['date']]),
+    })
+
+    # Количество и цена необязательны; храним их в целых единицах
+    rows['asset'] = None
+    rows['quantity'] = pd.array([None] * len(rows), dtype='Int64')
+    rows['price'] = pd.array([None] * len(rows), dtype='Int64')
+    if 'quantity' in mapping:
+        quantities = to_numbers(frame[mapping['quantity']])
+        prices = to_numbers(frame[mapping['price']]) if 'price' in mapping else rows['amount'] / quantities
+        known = (quantities > 0) & (prices > 0)
+        rows['quantity'] = (quantities * QUANTITY_SCALE).round().where(known).astype('Int64')
+        rows['price'] = (prices * PRICE_SCALE).round().where(known).astype('Int64')
+        assets = frame[mapping['asset']].astype(str).str.strip().str.upper() if 'asset' in mapping else DEFAULT_ASSET
+        rows['asset'] = pd.Series(assets, index=rows.index).where(known, None)
+
+    valid = rows['transaction_type'].notna() & rows['date'].notna() & (rows['amount'] > 0)
+    if 'status' in mapping:
+        statuses = frame[mapping['status']].astype(str).str.strip().str.lower()
+        valid &= statuses.isin(COMPLETED_STATUSES)
+
+    if 'order_id' in mapping:
+        external_ids = frame[mapping['order_id']].astype(str).str.strip()
+        valid &= frame[mapping['order_id']].notna() & (external_ids != '')
+    else:
+        # Без номера ордера ключом служат дата, тип и сумма
+        external_ids = (
+            rows['date'].astype(str) + '|' + rows['transaction_type'].astype(str)
+            + '|' + rows['amount'].astype(str)
+        )
+    rows['external_id'] = external_ids
+    rows = rows[valid]
+
+    return [
+        {
+            'external_id': row.external_id,
+            'transaction_type': row.transaction_type,
+            'amount': float(row.amount),
+            'date': row.date.to_pydatetime(),
+            'asset': row.asset,
+            'quantity': None if pd.isna(row.quantity) else int(row.quantity),
+            'price': None if pd.isna(row.price) else int(row.price),
+        }
+        for row in rows.itertuples(index=False)
+    ]
+
+async def insert_new_transactions(session, user_id, records, action='import'):
+    """Вставляет записи одним executemany, пропуская уже сохраненные external_id
+
+    Возвращает число добавленных строк. Коммит остается за вызывающим кодом.
+    """
+    if not records:
+        return 0
+
+    existing = set((await session.execute(
+        select(P2PTransaction.external_id).where(
+            P2PTransaction.user_id == user_id,
+            P2PTransaction.external_id.in_([r['external_id'] for r in records])
+        )
+    )).scalars())
+    new_rows = []
+    for record in records:
+        if record['external_id'] in existing:
+            continue
+        existing.add(record['external_id'])
+        new_rows.append(dict(record, user_id=user_id))
+
+    if new_rows:
+        await session.execute(insert(P2PTransaction), new_rows)
+        await record_change(session, user_id, action, [
+            added(row['transaction_type'], row['amount'], row['date']) for row in new_rows
+        ])
+    return len(new_rows)
+
+async def import_orders(write_batcher, user_id, path, on_progress=None, chunk_size=IMPORT_CHUNK_SIZE):
+    """Импортирует выгрузку ордеров, пропуская уже сохраненные
+
+    Каждая часть файла коммитится отдельно через write_batcher, поэтому
+    блокировка записи не держится на время разбора и отчета о прогрессе.
+    Прерванный импорт можно повторить: сохраненные строки отсеются по external_id.
+    Возвращает словарь со счетчиками processed, imported, duplicates и rejected.
+    """
+    result = {'processed': 0, 'imported': 0, 'duplicates': 0, 'rejected': 0}
+    frames = iter_frames(path, chunk_size)
+    mapping = None
+
+    while True:
+        # Чтение и разбор файла выполняются вне event loop
+        frame = await asyncio.to_thread(next, frames, None)
+        if frame is None:
+            break
+        if mapping is None:
+            mapping = resolve_columns(frame.columns)
+        records = await asyncio.to_thread(normalize_frame, frame, mapping)
+
+        async def save(session, records=records):
+            return await insert_new_transactions(session, user_id, records)
+
+        imported = await write_batcher.submit(save)
+
+        result['processed'] += len(frame)
+        result['imported'] += imported
+        result['duplicates'] += len(records) - imported
+        result['rejected'] += len(frame) - len(records)
+        if on_progress is not None:
+            await on_progress(result)
+
+    return result
@@ -11,7 +11,12 @@ def get_main_keyboard() -> ReplyKeyboardMarkup:
         [KeyboardButton(text="💰 Добавить пополнение")],
         [KeyboardButton(text="💸 Добавить продажу")],
         [KeyboardButton(text="📝 Редактировать транзакции")],
-        [KeyboardButton(text="📊 Статистика")]
+        [KeyboardButton(text="📊 Статистика")],
+        [KeyboardButton(text="🧮 Аналитика")],
+        [KeyboardButton(text="📈 График")],
+        [KeyboardButton(text="📥 Импорт из Bybit")],
+        [KeyboardButton(text="🔄 Синхронизация с Bybit")],
+        [KeyboardButton(text="📤 Экспорт")]
     ]
     
     keyboard = ReplyKeyboardMarkup(
@@ -73,7 +78,15 @@ def get_transaction_type_keyboard() -> ReplyKeyboardMarkup:
     )
     return keyboard
 
-def get_transactions_list_keyboard(transactions) -> InlineKeyboardMarkup:
+def get_export_format_keyboard() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text="📗 Excel (.xlsx)", callback_data="export_xlsx"),
+            InlineKeyboardButton(text="📄 CSV", callback_data="export_csv")
+        ]
+    ])
+
+def get_transactions_list_keyboard(transactions, has_prev=False, has_next=False) -> InlineKeyboardMarkup:
     keyboard = InlineKeyboardMarkup(inline_keyboard=[])
     
     for t in transactions:
@@ -83,8 +96,36 @@ def get_transactions_list_keyboard(transactions) -> InlineKeyboardMarkup:
             InlineKeyboardButton(text=button_text, callback_data=f"edit_{t.id}")
         ])
     
+    # Курсор страницы - ключ (date, id) крайней транзакции
+    nav_row = []
+    if has_prev and transactions:
+        first = transactions[0]
+        nav_row.append(InlineKeyboardButton(
+            text="⬅️ Новее",
+            callback_data=f"txpage_prev_{first.date.isoformat()}_{first.id}"
+        ))
+    if has_next and transactions:
+        last = transactions[-1]
+        nav_row.append(InlineKeyboardButton(
+            text="Старее ➡️",
+            callback_data=f"txpage_next_{last.date.isoformat()}_{last.id}"
+        ))
+    if nav_row:
+        keyboard.inline_keyboard.append(nav_row)
+    
     keyboard.inline_keyboard.append([
         InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_edit")
     ])
     
-    return keyboard 
\ No newline at end of file
+    return keyboard
+
+def get_analytics_period_keyboard(current='month') -> InlineKeyboardMarkup:
+    labels = {'day': "По дням", 'week': "По неделям", 'month': "По месяцам"}
+    buttons = [
+        InlineKeyboardButton(
+            text=("• " if period == current else "") + label,
+            callback_data=f"analytics_{period}"
+        )
+        for period, label in labels.items()
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=[buttons])
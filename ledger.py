@@ -0,0 +1,253 @@
+import json
+from bisect import bisect_right
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import select, insert, update, delete, func, case, bindparam
+
+from models import P2PTransaction, LedgerEntry, UserBalance, BalanceSnapshot, DailyRollup
+from config import LEDGER_SNAPSHOT_INTERVAL
+
+TOTAL_FIELDS = ('buy_total', 'buy_count', 'sell_total', 'sell_count')
+ROLLUP_FIELDS = ('buy_amount', 'buy_count', 'sell_amount', 'sell_count')
+
+def transaction_delta(transaction_type, amount, sign=1):
+    """Изменение итогов от добавления (sign=1) или удаления (sign=-1) транзакции"""
+    delta = {'buy_amount': 0.0, 'buy_count': 0, 'sell_amount': 0.0, 'sell_count': 0}
+    if transaction_type in ('buy', 'sell'):
+        delta[f'{transaction_type}_amount'] = sign * amount
+        delta[f'{transaction_type}_count'] = sign
+    return delta
+
+def merge_deltas(*deltas):
+    merged = transaction_delta(None, 0)
+    for delta in deltas:
+        for field, value in delta.items():
+            merged[field] += value
+    return merged
+
+def added(transaction_type, amount, date):
+    return (transaction_type, amount, date, 1)
+
+def removed(transaction_type, amount, date):
+    return (transaction_type, amount, date, -1)
+
+async def _create_balance(session, user_id):
+    """Заводит итоги пользователя по уже сохраненным транзакциям"""
+    row = (await session.execute(
+        select(
+            func.coalesce(func.sum(case((P2PTransaction.transaction_type == 'buy', P2PTransaction.amount))), 0.0),
+            func.count(case((P2PTransaction.transaction_type == 'buy', 1))),
+            func.coalesce(func.sum(case((P2PTransaction.transaction_type == 'sell', P2PTransaction.amount))), 0.0),
+            func.count(case((P2PTransaction.transaction_type == 'sell', 1))),
+        ).where(P2PTransaction.user_id == user_id)
+    )).one()
+    balance = UserBalance(user_id=user_id, **dict(zip(TOTAL_FIELDS, row)))
+    session.add(balance)
+    return balance
+
+async def rebuild_rollups(session, user_id):
+    """Пересчитывает дневные итоги пользователя по всей истории"""
+    await session.execute(delete(DailyRollup).where(DailyRollup.user_id == user_id))
+    day = func.date(P2PTransaction.date)
+    await session.execute(insert(DailyRollup).from_select(
+        ['user_id', 'day', 'buy_amount', 'buy_count', 'sell_amount', 'sell_count'],
+        select(
+            P2PTransaction.user_id,
+            day,
+            func.coalesce(func.sum(case((P2PTransaction.transaction_type == 'buy', P2PTransaction.amount))), 0.0),
+            func.count(case((P2PTransaction.transaction_type == 'buy', 1))),
+            func.coalesce(func.sum(case((P2PTransaction.transaction_type == 'sell', P2PTransaction.amount))), 0.0),
+            func.count(case((P2PTransaction.transaction_type == 'sell', 1))),
+        ).where(P2PTransaction.user_id == user_id).group_by(P2PTransaction.user_id, day)
+    ))
+
+async def _apply_rollups(session, user_id, changes):
+    """Добавляет изменения к дневным итогам: один UPDATE и один INSERT на пакет
+
+    Возвращает число впервые появившихся дней.
+    """
+    by_day = {}
+    for transaction_type, amount, date, sign in changes:
+        delta = by_day.setdefault(date.date(), transaction_delta(None, 0))
+        for field, value in transaction_delta(transaction_type, amount, sign).items():
+            delta[field] += value
+
+    existing = set((await session.execute(
+        select(DailyRollup.day).where(
+            DailyRollup.user_id == user_id,
+            DailyRollup.day.in_(list(by_day))
+        )
+    )).scalars())
+    updates = [
+        {'b_day': day, **{f'b_{field}': value for field, value in delta.items()}}
+        for day, delta in by_day.items() if day in existing
+    ]
+    inserts = [dict(delta, user_id=user_id, day=day) for day, delta in by_day.items() if day not in existing]
+
+    if updates:
+        await session.execute(
+            update(DailyRollup.__table__).where(
+                DailyRollup.user_id == user_id,
+                DailyRollup.day == bindparam('b_day')
+            ).values(
+                buy_amount=DailyRollup.buy_amount + bindparam('b_buy_amount'),
+                buy_count=DailyRollup.buy_count + bindparam('b_buy_count'),
+                sell_amount=DailyRollup.sell_amount + bindparam('b_sell_amount'),
+                sell_count=DailyRollup.sell_count + bindparam('b_sell_count'),
+            ),
+            updates
+        )
+    if inserts:
+        await session.execute(insert(DailyRollup), inserts)
+    return len(inserts)
+
+async def _shift_snapshots(session, user_id, changes):
+    """Переносит изменения задним числом в снимки с днем не раньше даты операции"""
+    if not changes:
+        return
+    by_day = sorted((date.date(), transaction_type, amount, sign) for transaction_type, amount, date, sign in changes)
+    snapshots = (await session.execute(
+        select(BalanceSnapshot).where(
+            BalanceSnapshot.user_id == user_id,
+            BalanceSnapshot.day >= by_day[0][0]
+        )
+    )).scalars().all()
+    if not snapshots:
+        return
+
+    # Накопленные изменения по дням: снимку достается префикс до его дня
+    days, prefix, running = [], [], transaction_delta(None, 0)
+    for day, transaction_type, amount, sign in by_day:
+        running = merge_deltas(running, transaction_delta(transaction_type, amount, sign))
+        days.append(day)
+        prefix.append(running)
+    for snapshot in snapshots:
+        delta = prefix[bisect_right(days, snapshot.day) - 1]
+        for field, value in zip(TOTAL_FIELDS, delta.values()):
+            setattr(snapshot, field, getattr(snapshot, field) + value)
+
+async def rebuild_snapshots(session, user_id, interval=LEDGER_SNAPSHOT_INTERVAL):
+    """Пересоздает снимки на каждый interval-й день с операциями
+
+    Вызывается раз в interval новых дней, поэтому дни, добавленные задним
+    числом, тоже оказываются не дальше interval строк от снимка.
+    """
+    await session.execute(delete(BalanceSnapshot).where(BalanceSnapshot.user_id == user_id))
+    rows = (await session.execute(
+        select(DailyRollup.day, *(getattr(DailyRollup, c) for c in ROLLUP_FIELDS))
+        .where(DailyRollup.user_id == user_id).order_by(DailyRollup.day)
+    )).all()
+
+    totals = [0] * len(TOTAL_FIELDS)
+    snapshots = []
+    for number, (day, *values) in enumerate(rows, start=1):
+        totals = [total + value for total, value in zip(totals, values)]
+        if number % interval == 0:
+            snapshots.append(dict(zip(TOTAL_FIELDS, totals), user_id=user_id, day=day, created_at=datetime.now()))
+    if snapshots:
+        await session.execute(insert(BalanceSnapshot), snapshots)
+
+async def record_change(session, user_id, action, changes, transaction_id=None, details=None):
+    """Добавляет запись в журнал и обновляет итоги в текущей транзакции
+
+    changes - кортежи (transaction_type, amount, date, sign) из added()/removed().
+    Вызывается после записи самих транзакций; коммит остается за вызывающим кодом.
+    """
+    delta = merge_deltas(*(
+        transaction_delta(transaction_type, amount, sign)
+        for transaction_type, amount, _, sign in changes
+    ))
+    await session.flush()
+    result = await session.execute(
+        update(UserBalance).where(UserBalance.user_id == user_id).values(
+            buy_total=UserBalance.buy_total + delta['buy_amount'],
+            buy_count=UserBalance.buy_count + delta['buy_count'],
+            sell_total=UserBalance.sell_total + delta['sell_amount'],
+            sell_count=UserBalance.sell_count + delta['sell_count'],
+            updated_at=datetime.now()
+        ).execution_options(synchronize_session=False)
+    )
+    if result.rowcount:
+        balance = (await session.execute(
+            select(UserBalance).where(UserBalance.user_id == user_id)
+            .execution_options(populate_existing=True)
+        )).scalar_one()
+        balance.days_since_snapshot += await _apply_rollups(session, user_id, changes)
+        await _shift_snapshots(session, user_id, changes)
+    else:
+        # Итогов еще нет - агрегаты уже включают текущее изменение
+        balance = await _create_balance(session, user_id)
+        await rebuild_rollups(session, user_id)
+        balance.days_since_snapshot = LEDGER_SNAPSHOT_INTERVAL
+
+    entry = LedgerEntry(
+        user_id=user_id,
+        transaction_id=transaction_id,
+        action=action,
+        balance=balance.invested,
+        details=json.dumps(details, ensure_ascii=False, default=str) if details else None,
+        **delta
+    )
+    session.add(entry)
+    await session.flush()
+    balance.last_entry_id = entry.id
+
+    if balance.days_since_snapshot >= LEDGER_SNAPSHOT_INTERVAL:
+        await rebuild_snapshots(session, user_id)
+        balance.days_since_snapshot = 0
+    return entry
+
+async def get_balance(session, user_id):
+    """Итоги пользователя одним чтением по первичному ключу"""
+    return await session.get(UserBalance, user_id)
+
+async def _rollup_sums(session, user_id, *conditions):
+    row = (await session.execute(
+        select(
+            *(func.coalesce(func.sum(getattr(DailyRollup, c)), 0) for c in ROLLUP_FIELDS),
+            func.count(),
+        ).where(DailyRollup.user_id == user_id, *conditions)
+    )).one()
+    return list(row[:-1]), row[-1]
+
+async def balance_at(session, user_id, day):
+    """Итоги по операциям с датой не позже day
+
+    Считаются от ближайшего по дате снимка: дневные итоги между ним и day
+    прибавляются или вычитаются. Возвращает словарь с buy_total, buy_count,
+    sell_total и sell_count.
+    """
+    before = (await session.execute(
+        select(BalanceSnapshot).where(BalanceSnapshot.user_id == user_id, BalanceSnapshot.day <= day)
+        .order_by(BalanceSnapshot.day.desc()).limit(1)
+    )).scalar_one_or_none()
+    if before is not None and before.day == day:
+        return {field: getattr(before, field) for field in TOTAL_FIELDS}
+    after = (await session.execute(
+        select(BalanceSnapshot).where(BalanceSnapshot.user_id == user_id, BalanceSnapshot.day > day)
+        .order_by(BalanceSnapshot.day).limit(1)
+    )).scalar_one_or_none()
+
+    if before is not None and (after is None or day - before.day <= after.day - day):
+        sums, _ = await _rollup_sums(session, user_id, DailyRollup.day > before.day, DailyRollup.day <= day)
+        return {f: getattr(before, f) + value for f, value in zip(TOTAL_FIELDS, sums)}
+    if after is not None:
+        sums, _ = await _rollup_sums(session, user_id, DailyRollup.day > day, DailyRollup.day <= after.day)
+        return {f: getattr(after, f) - value for f, value in zip(TOTAL_FIELDS, sums)}
+
+    # Снимков нет - у пользователя меньше LEDGER_SNAPSHOT_INTERVAL дней с операциями
+    sums, days = await _rollup_sums(session, user_id, DailyRollup.day <= day)
+    if not days and await session.get(UserBalance, user_id) is None:
+        # Итоги еще не заведены - считаем по самим транзакциям
+        sums = (await session.execute(
+            select(
+                func.coalesce(func.sum(case((P2PTransaction.transaction_type == 'buy', P2PTransaction.amount))), 0.0),
+                func.count(case((P2PTransaction.transaction_type == 'buy', 1))),
+                func.coalesce(func.sum(case((P2PTransaction.transaction_type == 'sell', P2PTransaction.amount))), 0.0),
+                func.count(case((P2PTransaction.transaction_type == 'sell', 1))),
+            ).where(
+                P2PTransaction.user_id == user_id,
+                P2PTransaction.date < datetime.combine(day + timedelta(days=1), time.min)
+            )
+        )).one()
+    return dict(zip(TOTAL_FIELDS, sums))
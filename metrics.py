@@ -0,0 +1,112 @@
+import time
+from contextvars import ContextVar
+
+from aiohttp import web
+from prometheus_client import Counter, Histogram, Gauge, REGISTRY, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import CounterMetricFamily
+from sqlalchemy import event
+
+from config import logger, METRICS_HOST, METRICS_PORT
+
+UPDATES = Counter(
+    'bot_updates_total', 'Processed updates', ['event_type']
+)
+HANDLER_LATENCY = Histogram(
+    'bot_handler_duration_seconds', 'Handler execution time', ['handler'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+HANDLER_ERRORS = Counter(
+    'bot_handler_errors_total', 'Unhandled handler exceptions', ['handler', 'error']
+)
+FSM_TRANSITIONS = Counter(
+    'bot_fsm_transitions_total', 'FSM state transitions', ['from_state', 'to_state']
+)
+UPDATE_SQL_QUERIES = Histogram(
+    'bot_update_sql_queries', 'SQL queries per update',
+    buckets=(0, 1, 2, 3, 5, 10, 25, 50, 100)
+)
+UPDATE_SQL_TIME = Histogram(
+    'bot_update_sql_seconds', 'Time spent in SQL per update',
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+)
+SQL_QUERY_TIME = Histogram(
+    'bot_sql_query_seconds', 'Single SQL query execution time',
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5)
+)
+SEND_QUEUE_SIZE = Gauge(
+    'bot_send_queue_size', 'Messages waiting in the outbound queue'
+)
+
+class CounterCollector:
+    """Отдает накопительные счетчики объектов бота как counter, а не gauge
+
+    Значения читаются при каждом запросе /metrics; сброс при перезапуске
+    процесса rate() в Prometheus обрабатывает сам.
+    """
+
+    def __init__(self):
+        self._counters = {}  # имя -> (описание, функция без аргументов)
+
+    def watch(self, name, documentation, function):
+        self._counters[name] = (documentation, function)
+
+    def collect(self):
+        for name, (documentation, function) in self._counters.items():
+            yield CounterMetricFamily(name, documentation, value=function())
+
+COUNTERS = CounterCollector()
+REGISTRY.register(COUNTERS)
+
+# Счетчики SQL текущего апдейта: [число запросов, суммарное время]
+sql_stats: ContextVar = ContextVar('sql_stats', default=None)
+
+def instrument_engine(engine):
+    """Подписывается на события движка, чтобы считать запросы и их время"""
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._query_started
+        SQL_QUERY_TIME.observe(elapsed)
+        stats = sql_stats.get()
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += elapsed
+
+def watch_stats_cache(cache):
+    COUNTERS.watch('bot_stats_cache_hits', 'Statistics cache hits', lambda: cache.hits)
+    COUNTERS.watch('bot_stats_cache_misses', 'Statistics cache misses', lambda: cache.misses)
+
+def watch_send_queue(send_queue):
+    SEND_QUEUE_SIZE.set_function(send_queue.queue.qsize)
+    COUNTERS.watch('bot_send_queue_sent', 'Messages delivered by the outbound queue', lambda: send_queue.sent)
+    COUNTERS.watch('bot_send_queue_failed', 'Messages the outbound queue failed to deliver', lambda: send_queue.failed)
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(body=generate_latest(), headers={'Content-Type': CONTENT_TYPE_LATEST})
+
+class MetricsServer:
+    """Локальный HTTP-эндпоинт /metrics для Prometheus"""
+
+    def __init__(self, host=METRICS_HOST, port=METRICS_PORT):
+        self.host = host
+        self.port = port
+        self._runner = None
+
+    async def start(self):
+        if not self.port or self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get('/metrics', handle_metrics)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Metrics available at http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,77 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from config import logger
+from metrics import (
+    UPDATES, HANDLER_LATENCY, HANDLER_ERRORS, FSM_TRANSITIONS,
+    UPDATE_SQL_QUERIES, UPDATE_SQL_TIME, sql_stats
+)
+
+class DbSessionMiddleware(BaseMiddleware):
+    """Открывает короткую сессию БД на каждый апдейт и передает ее в хендлеры"""
+
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        async with self.session_factory() as session:
+            data['session'] = session
+            try:
+                return await handler(event, data)
+            except Exception as e:
+                logger.error(f"Rolling back session after error: {e}")
+                await session.rollback()
+                raise
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Считает апдейты и SQL-запросы, выполненные при обработке каждого из них"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        UPDATES.labels(event.event_type).inc()
+        stats = [0, 0.0]
+        token = sql_stats.set(stats)
+        try:
+            return await handler(event, data)
+        finally:
+            sql_stats.reset(token)
+            UPDATE_SQL_QUERIES.observe(stats[0])
+            UPDATE_SQL_TIME.observe(stats[1])
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Замеряет время хендлера, его ошибки и переходы FSM"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_object = data.get('handler')
+        name = handler_object.callback.__name__ if handler_object else 'unknown'
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            HANDLER_ERRORS.labels(name, type(e).__name__).inc()
+            raise
+        finally:
+            HANDLER_LATENCY.labels(name).observe(time.perf_counter() - started)
+            state = data.get('state')
+            if state is not None:
+                old_state = data.get('raw_state')
+                new_state = await state.get_state()
+                if new_state != old_state:
+                    FSM_TRANSITIONS.labels(old_state or 'none', new_state or 'none').inc()
@@ -0,0 +1,35 @@
+"""initial schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Таблица могла быть создана раньше через create_all
+    if sa.inspect(op.get_bind()).has_table('p2p_transactions'):
+        return
+    op.create_table(
+        'p2p_transactions',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('amount', sa.Float(), nullable=False),
+        sa.Column('transaction_type', sa.String(), nullable=False),
+        sa.Column('date', sa.DateTime(), nullable=True),
+        sa.Column('comment', sa.String(), nullable=True),
+    )
+
+
+def downgrade():
+    # Таблица могла существовать до миграций - не удаляем историю транзакций
+    pass
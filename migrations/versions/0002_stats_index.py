@@ -0,0 +1,32 @@
+"""covering index for statistics queries
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 12:10:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+INDEX_NAME = 'ix_p2p_transactions_user_type_date'
+
+
+def upgrade():
+    indexes = sa.inspect(op.get_bind()).get_indexes('p2p_transactions')
+    if any(index['name'] == INDEX_NAME for index in indexes):
+        return
+    op.create_index(
+        INDEX_NAME,
+        'p2p_transactions',
+        ['user_id', 'transaction_type', 'date', 'amount']
+    )
+
+
+def downgrade():
+    op.drop_index(INDEX_NAME, table_name='p2p_transactions')
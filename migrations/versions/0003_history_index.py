@@ -0,0 +1,28 @@
+"""index for keyset pagination of transaction history
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 13:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+INDEX_NAME = 'ix_p2p_transactions_user_date'
+
+
+def upgrade():
+    indexes = sa.inspect(op.get_bind()).get_indexes('p2p_transactions')
+    if any(index['name'] == INDEX_NAME for index in indexes):
+        return
+    op.create_index(INDEX_NAME, 'p2p_transactions', ['user_id', 'date', 'id'])
+
+
+def downgrade():
+    op.drop_index(INDEX_NAME, table_name='p2p_transactions')
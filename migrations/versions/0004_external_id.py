@@ -0,0 +1,33 @@
+"""external order id for imported transactions
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 14:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+INDEX_NAME = 'ux_p2p_transactions_user_external'
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    columns = inspector.get_columns('p2p_transactions')
+    if not any(column['name'] == 'external_id' for column in columns):
+        op.add_column('p2p_transactions', sa.Column('external_id', sa.String(), nullable=True))
+    indexes = inspector.get_indexes('p2p_transactions')
+    if not any(index['name'] == INDEX_NAME for index in indexes):
+        op.create_index(INDEX_NAME, 'p2p_transactions', ['user_id', 'external_id'], unique=True)
+
+
+def downgrade():
+    op.drop_index(INDEX_NAME, table_name='p2p_transactions')
+    with op.batch_alter_table('p2p_transactions') as batch_op:
+        batch_op.drop_column('external_id')
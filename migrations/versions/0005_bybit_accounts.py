@@ -0,0 +1,33 @@
+"""bybit accounts for order sync
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 15:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table('bybit_accounts'):
+        return
+    op.create_table(
+        'bybit_accounts',
+        sa.Column('user_id', sa.Integer(), primary_key=True),
+        sa.Column('api_key', sa.String(), nullable=False),
+        sa.Column('api_secret', sa.String(), nullable=False),
+        sa.Column('sync_enabled', sa.Boolean(), nullable=False),
+        sa.Column('last_order_time', sa.Integer(), nullable=True),
+        sa.Column('last_synced_at', sa.DateTime(), nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_table('bybit_accounts')
@@ -0,0 +1,99 @@
+"""balance ledger, user balances and snapshots
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 18:00:00
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table('user_balances'):
+        return
+    op.create_table(
+        'ledger_entries',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('transaction_id', sa.Integer(), nullable=True),
+        sa.Column('action', sa.String(), nullable=False),
+        sa.Column('buy_amount', sa.Float(), nullable=False),
+        sa.Column('buy_count', sa.Integer(), nullable=False),
+        sa.Column('sell_amount', sa.Float(), nullable=False),
+        sa.Column('sell_count', sa.Integer(), nullable=False),
+        sa.Column('balance', sa.Float(), nullable=False),
+        sa.Column('details', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+    )
+    op.create_index('ix_ledger_entries_user_id', 'ledger_entries', ['user_id', 'id'])
+    op.create_table(
+        'user_balances',
+        sa.Column('user_id', sa.Integer(), primary_key=True),
+        sa.Column('buy_total', sa.Float(), nullable=False),
+        sa.Column('buy_count', sa.Integer(), nullable=False),
+        sa.Column('sell_total', sa.Float(), nullable=False),
+        sa.Column('sell_count', sa.Integer(), nullable=False),
+        sa.Column('last_entry_id', sa.Integer(), nullable=True),
+        sa.Column('entries_since_snapshot', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+    )
+    op.create_table(
+        'balance_snapshots',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('entry_id', sa.Integer(), nullable=False),
+        sa.Column('buy_total', sa.Float(), nullable=False),
+        sa.Column('buy_count', sa.Integer(), nullable=False),
+        sa.Column('sell_total', sa.Float(), nullable=False),
+        sa.Column('sell_count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+    )
+    op.create_index('ix_balance_snapshots_user_created', 'balance_snapshots', ['user_id', 'created_at'])
+
+    # Начальные остатки по существующей истории: запись журнала, итоги и снимок.
+    # Время записи - локальное, как у datetime.now в коде бота
+    op.execute(sa.text("""
+        INSERT INTO ledger_entries
+            (user_id, action, buy_amount, buy_count, sell_amount, sell_count, balance, created_at)
+        SELECT user_id, 'opening', buy_amount, buy_count, sell_amount, sell_count,
+               buy_amount - sell_amount, :now
+        FROM (
+            SELECT user_id,
+                   COALESCE(SUM(CASE WHEN transaction_type = 'buy' THEN amount END), 0) AS buy_amount,
+                   COUNT(CASE WHEN transaction_type = 'buy' THEN 1 END) AS buy_count,
+                   COALESCE(SUM(CASE WHEN transaction_type = 'sell' THEN amount END), 0) AS sell_amount,
+                   COUNT(CASE WHEN transaction_type = 'sell' THEN 1 END) AS sell_count
+            FROM p2p_transactions
+            GROUP BY user_id
+        ) AS totals
+    """).bindparams(now=datetime.now()))
+    op.execute("""
+        INSERT INTO user_balances
+            (user_id, buy_total, buy_count, sell_total, sell_count,
+             last_entry_id, entries_since_snapshot, updated_at)
+        SELECT user_id, buy_amount, buy_count, sell_amount, sell_count, id, 0, created_at
+        FROM ledger_entries
+    """)
+    op.execute("""
+        INSERT INTO balance_snapshots
+            (user_id, entry_id, buy_total, buy_count, sell_total, sell_count, created_at)
+        SELECT user_id, id, buy_amount, buy_count, sell_amount, sell_count, created_at
+        FROM ledger_entries
+    """)
+
+
+def downgrade():
+    op.drop_index('ix_balance_snapshots_user_created', table_name='balance_snapshots')
+    op.drop_table('balance_snapshots')
+    op.drop_table('user_balances')
+    op.drop_index('ix_ledger_entries_user_id', table_name='ledger_entries')
+    op.drop_table('ledger_entries')
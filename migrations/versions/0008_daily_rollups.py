@@ -0,0 +1,43 @@
+"""daily rollups for analytics
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 19:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table('daily_rollups'):
+        return
+    op.create_table(
+        'daily_rollups',
+        sa.Column('user_id', sa.Integer(), primary_key=True),
+        sa.Column('day', sa.Date(), primary_key=True),
+        sa.Column('buy_amount', sa.Float(), nullable=False),
+        sa.Column('buy_count', sa.Integer(), nullable=False),
+        sa.Column('sell_amount', sa.Float(), nullable=False),
+        sa.Column('sell_count', sa.Integer(), nullable=False),
+    )
+    op.execute("""
+        INSERT INTO daily_rollups (user_id, day, buy_amount, buy_count, sell_amount, sell_count)
+        SELECT user_id, date(date),
+               COALESCE(SUM(CASE WHEN transaction_type = 'buy' THEN amount END), 0),
+               COUNT(CASE WHEN transaction_type = 'buy' THEN 1 END),
+               COALESCE(SUM(CASE WHEN transaction_type = 'sell' THEN amount END), 0),
+               COUNT(CASE WHEN transaction_type = 'sell' THEN 1 END)
+        FROM p2p_transactions
+        GROUP BY user_id, date(date)
+    """)
+
+
+def downgrade():
+    op.drop_table('daily_rollups')
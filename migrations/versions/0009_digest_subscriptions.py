@@ -0,0 +1,33 @@
+"""digest subscriptions
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18 20:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table('digest_subscriptions'):
+        return
+    op.create_table(
+        'digest_subscriptions',
+        sa.Column('user_id', sa.Integer(), primary_key=True),
+        sa.Column('frequency', sa.String(), nullable=False),
+        sa.Column('last_sent_at', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+    )
+    op.create_index('ix_digest_subscriptions_frequency', 'digest_subscriptions', ['frequency', 'user_id'])
+
+
+def downgrade():
+    op.drop_index('ix_digest_subscriptions_frequency', table_name='digest_subscriptions')
+    op.drop_table('digest_subscriptions')
@@ -0,0 +1,34 @@
+"""asset quantity and price in fixed point
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18 21:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+COLUMNS = (
+    ('asset', sa.String()),
+    ('quantity', sa.BigInteger()),
+    ('price', sa.BigInteger()),
+)
+
+
+def upgrade():
+    existing = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('p2p_transactions')}
+    for name, type_ in COLUMNS:
+        if name not in existing:
+            op.add_column('p2p_transactions', sa.Column(name, type_, nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('p2p_transactions') as batch_op:
+        for name, _ in reversed(COLUMNS):
+            batch_op.drop_column(name)
@@ -0,0 +1,81 @@
+"""balance snapshots keyed by operation date
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-19 10:00:00
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+from config import LEDGER_SNAPSHOT_INTERVAL
+
+
+revision = '0011'
+down_revision = '0010'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    snapshot_columns = {column['name'] for column in inspector.get_columns('balance_snapshots')}
+    if 'day' in snapshot_columns:
+        return
+
+    # Снимки по времени записи заменяются снимками по дате операций
+    op.drop_index('ix_balance_snapshots_user_created', table_name='balance_snapshots')
+    op.drop_table('balance_snapshots')
+    op.create_table(
+        'balance_snapshots',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('buy_total', sa.Float(), nullable=False),
+        sa.Column('buy_count', sa.Integer(), nullable=False),
+        sa.Column('sell_total', sa.Float(), nullable=False),
+        sa.Column('sell_count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('user_id', 'day'),
+    )
+    with op.batch_alter_table('user_balances') as batch_op:
+        batch_op.alter_column('entries_since_snapshot', new_column_name='days_since_snapshot')
+
+    # Снимок на каждый LEDGER_SNAPSHOT_INTERVAL-й день с операциями
+    op.execute(sa.text("""
+        INSERT INTO balance_snapshots
+            (user_id, day, buy_total, buy_count, sell_total, sell_count, created_at)
+        SELECT user_id, day, buy_total, buy_count, sell_total, sell_count, :now
+        FROM (
+            SELECT user_id, day,
+                   SUM(buy_amount) OVER w AS buy_total,
+                   SUM(buy_count) OVER w AS buy_count,
+                   SUM(sell_amount) OVER w AS sell_total,
+                   SUM(sell_count) OVER w AS sell_count,
+                   ROW_NUMBER() OVER w AS number
+            FROM daily_rollups
+            WINDOW w AS (PARTITION BY user_id ORDER BY day)
+        ) AS running
+        WHERE number % :interval = 0
+    """).bindparams(now=datetime.now(), interval=LEDGER_SNAPSHOT_INTERVAL))
+    op.execute(sa.text("UPDATE user_balances SET days_since_snapshot = 0"))
+
+
+def downgrade():
+    op.drop_table('balance_snapshots')
+    op.create_table(
+        'balance_snapshots',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('entry_id', sa.Integer(), nullable=False),
+        sa.Column('buy_total', sa.Float(), nullable=False),
+        sa.Column('buy_count', sa.Integer(), nullable=False),
+        sa.Column('sell_total', sa.Float(), nullable=False),
+        sa.Column('sell_count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_balance_snapshots_user_created', 'balance_snapshots', ['user_id', 'created_at'])
+    with op.batch_alter_table('user_balances') as batch_op:
+        batch_op.alter_column('days_since_snapshot', new_column_name='entries_since_snapshot')
@@ -1,25 +1,189 @@
-from sqlalchemy import create_engine, Column, Integer, Float, String, DateTime, Boolean
+from sqlalchemy import event, inspect, text, Column, Integer, BigInteger, Float, String, Text, Date, DateTime, Boolean, Index
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from datetime import datetime
 
 Base = declarative_base()
 
+# Последняя миграция в migrations/versions - обновлять вместе с новой ревизией
+SCHEMA_VERSION = '0011'
+
+# Синхронные драйверы и их асинхронные аналоги
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+}
+
 class P2PTransaction(Base):
     __tablename__ = 'p2p_transactions'
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, nullable=False)
-    amount = Column(Float, nullable=False)
+    amount = Column(Float, nullable=False)  # рубли; точный расчет FIFO ведется по quantity и price
     transaction_type = Column(String, nullable=False)  # 'buy' or 'sell'
     date = Column(DateTime, default=datetime.now)
     comment = Column(String, nullable=True)
+    external_id = Column(String, nullable=True)  # номер ордера Bybit
+    asset = Column(String, nullable=True)  # 'USDT', 'BTC', ...
+    quantity = Column(BigInteger, nullable=True)  # количество актива * 10^6
+    price = Column(BigInteger, nullable=True)  # цена за единицу в копейках
+
+    __table_args__ = (
+        # Покрывающий индекс для статистики: суммы и последние операции по типу
+        Index('ix_p2p_transactions_user_type_date', 'user_id', 'transaction_type', 'date', 'amount'),
+        # Индекс для постраничного просмотра истории по ключу (date, id)
+        Index('ix_p2p_transactions_user_date', 'user_id', 'date', 'id'),
+        # Естественный ключ для импорта и синхронизации ордеров
+        Index('ux_p2p_transactions_user_external', 'user_id', 'external_id', unique=True),
+    )
 
     def __repr__(self):
         return f"<P2PTransaction(user_id={self.user_id}, amount={self.amount}, date={self.date}, type={self.transaction_type})>"
 
-def init_db(database_url):
-    engine = create_engine(database_url)
-    Base.metadata.create_all(engine)
-    Session = sessionmaker(bind=engine)
-    return Session() 
\ No newline at end of file
+class BybitAccount(Base):
+    __tablename__ = 'bybit_accounts'
+
+    user_id = Column(Integer, primary_key=True)
+    api_key = Column(String, nullable=False)
+    api_secret = Column(String, nullable=False)
+    sync_enabled = Column(Boolean, nullable=False, default=True)
+    last_order_time = Column(Integer, nullable=True)  # курсор синхронизации, мс
+    last_synced_at = Column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<BybitAccount(user_id={self.user_id}, sync_enabled={self.sync_enabled})>"
+
+class FSMRecord(Base):
+    __tablename__ = 'fsm_states'
+
+    key = Column(String, primary_key=True)
+    state = Column(String, nullable=True)
+    data = Column(Text, nullable=True)  # JSON
+    updated_at = Column(DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<FSMRecord(key={self.key}, state={self.state})>"
+
+class LedgerEntry(Base):
+    __tablename__ = 'ledger_entries'
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    transaction_id = Column(Integer, nullable=True)  # None для пакетных записей
+    action = Column(String, nullable=False)  # 'add', 'edit', 'import', 'sync', 'opening'
+    buy_amount = Column(Float, nullable=False, default=0.0)
+    buy_count = Column(Integer, nullable=False, default=0)
+    sell_amount = Column(Float, nullable=False, default=0.0)
+    sell_count = Column(Integer, nullable=False, default=0)
+    balance = Column(Float, nullable=False)  # вложено после изменения
+    details = Column(Text, nullable=True)  # JSON: старые и новые значения полей
+    created_at = Column(DateTime, nullable=False, default=datetime.now)
+
+    __table_args__ = (
+        Index('ix_ledger_entries_user_id', 'user_id', 'id'),
+    )
+
+    def __repr__(self):
+        return f"<LedgerEntry(user_id={self.user_id}, action={self.action}, balance={self.balance})>"
+
+class UserBalance(Base):
+    __tablename__ = 'user_balances'
+
+    user_id = Column(Integer, primary_key=True)
+    buy_total = Column(Float, nullable=False, default=0.0)
+    buy_count = Column(Integer, nullable=False, default=0)
+    sell_total = Column(Float, nullable=False, default=0.0)
+    sell_count = Column(Integer, nullable=False, default=0)
+    last_entry_id = Column(Integer, nullable=True)
+    days_since_snapshot = Column(Integer, nullable=False, default=0)  # дни с операциями после снимка
+    updated_at = Column(DateTime, nullable=False, default=datetime.now)
+
+    @property
+    def invested(self):
+        return self.buy_total - self.sell_total
+
+    def __repr__(self):
+        return f"<UserBalance(user_id={self.user_id}, invested={self.invested})>"
+
+class BalanceSnapshot(Base):
+    """Итоги по операциям с датой не позже day"""
+    __tablename__ = 'balance_snapshots'
+
+    user_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    buy_total = Column(Float, nullable=False)
+    buy_count = Column(Integer, nullable=False)
+    sell_total = Column(Float, nullable=False)
+    sell_count = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.now)
+
+    def __repr__(self):
+        return f"<BalanceSnapshot(user_id={self.user_id}, day={self.day})>"
+
+class DailyRollup(Base):
+    __tablename__ = 'daily_rollups'
+
+    user_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)  # дата операции, не дата записи
+    buy_amount = Column(Float, nullable=False, default=0.0)
+    buy_count = Column(Integer, nullable=False, default=0)
+    sell_amount = Column(Float, nullable=False, default=0.0)
+    sell_count = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<DailyRollup(user_id={self.user_id}, day={self.day})>"
+
+class DigestSubscription(Base):
+    __tablename__ = 'digest_subscriptions'
+
+    user_id = Column(Integer, primary_key=True)
+    frequency = Column(String, nullable=False)  # 'daily', 'weekly' or 'monthly'
+    last_sent_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.now)
+
+    __table_args__ = (
+        Index('ix_digest_subscriptions_frequency', 'frequency', 'user_id'),
+    )
+
+    def __repr__(self):
+        return f"<DigestSubscription(user_id={self.user_id}, frequency={self.frequency})>"
+
+def get_async_url(database_url):
+    """Переводит URL базы данных на асинхронный драйвер"""
+    scheme, sep, rest = database_url.partition('://')
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}"
+
+def apply_sqlite_pragmas(engine, pragmas):
+    """Выставляет PRAGMA на каждом новом соединении SQLite"""
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+def stored_schema_version(connection):
+    """Ревизия Alembic, записанная в базе, или None для базы без миграций"""
+    if not inspect(connection).has_table('alembic_version'):
+        return None
+    return connection.execute(text('SELECT version_num FROM alembic_version')).scalar()
+
+async def init_async_db(database_url, pool_size=5, max_overflow=10, pool_timeout=30, sqlite_pragmas=None):
+    """Создает асинхронный движок с ограниченным пулом и возвращает фабрику сессий"""
+    engine = create_async_engine(
+        get_async_url(database_url),
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout
+    )
+    if sqlite_pragmas and engine.dialect.name == 'sqlite':
+        apply_sqlite_pragmas(engine.sync_engine, sqlite_pragmas)
+    async with engine.begin() as conn:
+        # Схема, доведенная миграциями до текущей ревизии, не требует проверки таблиц
+        if await conn.run_sync(stored_schema_version) != SCHEMA_VERSION:
+            await conn.run_sync(Base.metadata.create_all)
+    return sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
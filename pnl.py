@@ -0,0 +1,158 @@
+from collections import OrderedDict
+from decimal import Decimal, ROUND_HALF_UP
+
+from sqlalchemy import select
+
+from models import P2PTransaction, UserBalance
+
+# Количество актива хранится в миллионных долях, цена - в копейках за единицу
+QUANTITY_SCALE = 10 ** 6
+PRICE_SCALE = 100
+MAX_CACHED_USERS = 10000
+
+def to_quantity(value):
+    """Переводит количество актива в целые миллионные доли без ошибок округления float"""
+    return int((Decimal(str(value)) * QUANTITY_SCALE).quantize(Decimal(1), ROUND_HALF_UP))
+
+def to_price(value):
+    return int((Decimal(str(value)) * PRICE_SCALE).quantize(Decimal(1), ROUND_HALF_UP))
+
+def price_for(amount, quantity):
+    """Цена за единицу в копейках по сумме сделки в рублях и количеству в единицах QUANTITY_SCALE"""
+    price = Decimal(str(amount)) * PRICE_SCALE * QUANTITY_SCALE / quantity
+    return int(price.quantize(Decimal(1), ROUND_HALF_UP))
+
+def to_rubles(value):
+    """Переводит сумму в единицах количество * копейки в рубли"""
+    return value / (QUANTITY_SCALE * PRICE_SCALE)
+
+class FixedRateSource:
+    """Курсы из словаря {актив: рублей за единицу}, например из настроек или тестов"""
+
+    def __init__(self, rates):
+        self.rates = {asset.upper(): to_price(rate) for asset, rate in rates.items()}
+
+    async def get_rates(self, assets):
+        return {asset: self.rates[asset] for asset in assets if asset in self.rates}
+
+def _cost_of_first(quantity, bought, costs, prices):
+    """Стоимость первых quantity единиц из потока покупок (кусочно-линейная функция)"""
+    import numpy as np
+    index = np.searchsorted(bought, quantity, side='left')
+    index = np.minimum(index, len(bought) - 1)
+    previous_bought = np.concatenate(([0], bought))[index]
+    previous_cost = np.concatenate(([0], costs))[index]
+    return previous_cost + (quantity - previous_bought) * prices[index]
+
+def fifo(sides, quantities, prices):
+    """Сопоставляет продажи с покупками по FIFO для одного актива
+
+    Массивы идут в хронологическом порядке; quantities и prices - целые числа
+    в единицах QUANTITY_SCALE и PRICE_SCALE. Денежные итоги возвращаются в
+    единицах количество * копейки (int64 вмещает ~9 * 10^10 ₽ оборота по
+    активу). Продажа может закрыть только купленное до нее; остаток продажи
+    без покупок не имеет себестоимости и учитывается в unmatched.
+    """
+    import numpy as np
+    is_buy = sides == 'buy'
+    buy_quantities, buy_prices = quantities[is_buy], prices[is_buy]
+    sell_quantities, sell_prices = quantities[~is_buy], prices[~is_buy]
+
+    bought = np.cumsum(buy_quantities)
+    costs = np.cumsum(buy_quantities * buy_prices)
+    total_bought = int(bought[-1]) if len(bought) else 0
+    total_cost = int(costs[-1]) if len(costs) else 0
+
+    # Закрыто к j-й продаже: M_j = min(M_{j-1} + q_j, A_j), где A_j - куплено до нее.
+    # Развернутая рекурсия: M_j = S_j + min(0, min_{k<=j}(A_k - S_k))
+    sold = np.cumsum(sell_quantities)
+    available = np.cumsum(np.where(is_buy, quantities, 0))[~is_buy]
+    matched = sold + np.minimum(np.minimum.accumulate(available - sold), 0) if len(sold) else sold
+
+    if len(bought) and len(matched):
+        cost_at = _cost_of_first(matched, bought, costs, buy_prices)
+    else:
+        cost_at = np.zeros(len(matched), dtype=np.int64)
+    matched_quantities = np.diff(matched, prepend=0)
+    realized = matched_quantities * sell_prices - np.diff(cost_at, prepend=0)
+
+    total_sold = int(sold[-1]) if len(sold) else 0
+    matched_total = int(matched[-1]) if len(matched) else 0
+    return {
+        'bought': total_bought,
+        'sold': total_sold,
+        'unmatched': total_sold - matched_total,
+        'realized': int(realized.sum()),
+        'remaining': total_bought - matched_total,
+        'remaining_cost': total_cost - (int(cost_at[-1]) if len(cost_at) else 0),
+        'last_price': int(prices[-1]) if len(prices) else 0,
+    }
+
+class PnLEngine:
+    """Реализованная и нереализованная прибыль по FIFO с кэшем до следующей записи"""
+
+    def __init__(self, rate_source):
+        self.rate_source = rate_source
+        self._cache = OrderedDict()  # user_id -> (версия данных, {актив: итоги FIFO})
+
+    async def _load(self, session, user_id):
+        rows = (await session.execute(
+            select(
+                P2PTransaction.asset, P2PTransaction.transaction_type,
+                P2PTransaction.quantity, P2PTransaction.price
+            ).where(
+                P2PTransaction.user_id == user_id,
+                P2PTransaction.asset.is_not(None),
+                P2PTransaction.quantity.is_not(None),
+                P2PTransaction.price.is_not(None)
+            ).order_by(P2PTransaction.date, P2PTransaction.id)
+        )).all()
+        if not rows:
+            return {}
+
+        # numpy загружается при первом расчете, а не при импорте модуля
+        import numpy as np
+        assets, sides, quantities, prices = zip(*rows)
+        assets = np.array(assets)
+        sides = np.array(sides)
+        quantities = np.fromiter(quantities, dtype=np.int64, count=len(rows))
+        prices = np.fromiter(prices, dtype=np.int64, count=len(rows))
+        positions = {}
+        for asset in np.unique(assets):
+            selected = assets == asset
+            positions[str(asset)] = fifo(sides[selected], quantities[selected], prices[selected])
+        return positions
+
+    async def _positions(self, session, user_id):
+        balance = await session.get(UserBalance, user_id)
+        version = balance.last_entry_id if balance else 0
+        cached = self._cache.get(user_id)
+        if cached is not None and cached[0] == version:
+            self._cache.move_to_end(user_id)
+            return cached[1]
+
+        positions = await self._load(session, user_id)
+        self._cache[user_id] = (version, positions)
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > MAX_CACHED_USERS:
+            self._cache.popitem(last=False)
+        return positions
+
+    async def report(self, session, user_id):
+        """Итоги по активам в рублях; без курса позиция оценивается по последней сделке"""
+        positions = await self._positions(session, user_id)
+        rates = await self.rate_source.get_rates(list(positions))
+        report = {}
+        for asset, position in positions.items():
+            rate = rates.get(asset, position['last_price'])
+            value = position['remaining'] * rate
+            report[asset] = {
+                'remaining': position['remaining'] / QUANTITY_SCALE,
+                'unmatched': position['unmatched'] / QUANTITY_SCALE,
+                'realized': to_rubles(position['realized']),
+                'unrealized': to_rubles(value - position['remaining_cost']),
+                'cost': to_rubles(position['remaining_cost']),
+                'rate': rate / PRICE_SCALE,
+                'rate_is_last_trade': asset not in rates,
+            }
+        return report
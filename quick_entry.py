@@ -0,0 +1,47 @@
+import re
+from datetime import datetime
+
+MAX_LINES = 500
+
+# Принимаются: "+5000 25.02.2024", "-1 200,50", "+5000", "+1 000 000 01.03.2024"
+# Отклоняются: "+5000 25.02", "+5000 2024", "+50 00" - пробел разделяет только
+# тысячи, а после суммы допустима только полная дата ДД.ММ.ГГГГ
+ENTRY_PATTERN = re.compile(
+    r'^(?P<sign>[+-])\s*(?P<amount>(?:\d{1,3}(?:[ \u00a0]\d{3})+|\d+)(?:[.,]\d+)?)'
+    r'(?:\s+(?P<date>\d{2}\.\d{2}\.\d{4}))?$'
+)
+QUICK_ENTRY_PATTERN = r'^\s*[+-]\s*\d'
+
+def parse_quick_entries(text, now=None):
+    """Разбирает строки быстрого ввода
+
+    Возвращает (entries, errors): entries - словари для P2PTransaction,
+    errors - номера строк, которые не удалось разобрать.
+    """
+    now = now or datetime.now()
+    entries = []
+    errors = []
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+
+    for number, line in enumerate(lines[:MAX_LINES], start=1):
+        match = ENTRY_PATTERN.match(line)
+        if match is None:
+            errors.append(number)
+            continue
+        amount = float(re.sub(r'\s', '', match['amount']).replace(',', '.'))
+        try:
+            date = datetime.strptime(match['date'], "%d.%m.%Y") if match['date'] else now
+        except ValueError:
+            errors.append(number)
+            continue
+        if amount <= 0:
+            errors.append(number)
+            continue
+        entries.append({
+            'amount': amount,
+            'transaction_type': 'buy' if match['sign'] == '+' else 'sell',
+            'date': date,
+        })
+
+    errors.extend(range(MAX_LINES + 1, len(lines) + 1))
+    return entries, errors
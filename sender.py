@@ -0,0 +1,153 @@
+import asyncio
+from collections import OrderedDict
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+
+from ratelimit import TokenBucket
+from config import (
+    logger, SEND_GLOBAL_RATE, SEND_CHAT_RATE, SEND_CHAT_BURST,
+    SEND_QUEUE_MAX_SIZE, SEND_QUEUE_WORKERS, SEND_MAX_RETRIES
+)
+
+MAX_CHAT_BUCKETS = 10000
+DRAIN_TIMEOUT = 10  # seconds to deliver the backlog on shutdown
+
+class DeliveryCounter:
+    """Счетчики доставки группы сообщений, например одной рассылки"""
+
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self._pending = 0
+        self._done = asyncio.Event()
+        self._done.set()
+
+    def add(self):
+        self._pending += 1
+        self._done.clear()
+
+    def finish(self, delivered):
+        if delivered:
+            self.sent += 1
+        else:
+            self.failed += 1
+        self._pending -= 1
+        if not self._pending:
+            self._done.set()
+
+    async def wait(self):
+        """Дожидается обработки всех сообщений группы"""
+        await self._done.wait()
+
+class SendQueue:
+    """Очередь исходящих сообщений с общим и per-chat ограничением частоты"""
+
+    def __init__(self, global_rate=SEND_GLOBAL_RATE, chat_rate=SEND_CHAT_RATE,
+                 chat_burst=SEND_CHAT_BURST, max_size=SEND_QUEUE_MAX_SIZE,
+                 workers=SEND_QUEUE_WORKERS, max_retries=SEND_MAX_RETRIES):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.workers = workers
+        self.max_retries = max_retries
+        self.queue = asyncio.Queue(maxsize=max_size)
+        self.bot = None
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.retried = 0
+        self._chat_buckets = OrderedDict()  # chat_id -> TokenBucket
+        self._resume_at = 0.0
+        self._tasks = []
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            if len(self._chat_buckets) > MAX_CHAT_BUCKETS:
+                self._chat_buckets.popitem(last=False)
+        self._chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    def submit(self, chat_id, text, **kwargs):
+        """Ставит сообщение в очередь без ожидания; False, если очередь переполнена"""
+        try:
+            self.queue.put_nowait((chat_id, text, kwargs, None))
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+    async def send(self, chat_id, text, counter=None, **kwargs):
+        """Ставит сообщение в очередь, дожидаясь свободного места
+
+        Результат доставки учитывается в counter (DeliveryCounter), если он передан.
+        """
+        if counter is not None:
+            counter.add()
+        await self.queue.put((chat_id, text, kwargs, counter))
+
+    async def _deliver(self, chat_id, text, kwargs):
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.max_retries + 1):
+            # После RetryAfter вся очередь ждет, пока Telegram снимет ограничение
+            delay = self._resume_at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self._chat_bucket(chat_id).acquire()
+            await self.global_bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id, text, **kwargs)
+                self.sent += 1
+                return True
+            except TelegramRetryAfter as e:
+                self._resume_at = max(self._resume_at, loop.time() + e.retry_after)
+                self.retried += 1
+                logger.warning(f"Flood limit hit, pausing sends for {e.retry_after}s")
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                # Бот заблокирован или чат недоступен - повтор не поможет
+                logger.info(f"Message to {chat_id} rejected: {e}")
+                break
+            except Exception as e:
+                logger.error(f"Failed to send message to {chat_id}: {e}")
+                break
+        self.failed += 1
+        return False
+
+    async def _worker(self):
+        while True:
+            chat_id, text, kwargs, counter = await self.queue.get()
+            delivered = False
+            try:
+                delivered = await self._deliver(chat_id, text, kwargs)
+            finally:
+                self.queue.task_done()
+                if counter is not None:
+                    counter.finish(delivered)
+
+    async def start(self, bot: Bot):
+        if self._tasks:
+            return
+        self.bot = bot
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        try:
+            await asyncio.wait_for(self.queue.join(), DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"Dropping {self.queue.qsize()} unsent messages on shutdown")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def info(self):
+        return {
+            'queued': self.queue.qsize(),
+            'max_size': self.queue.maxsize,
+            'sent': self.sent,
+            'failed': self.failed,
+            'dropped': self.dropped,
+            'retried': self.retried,
+        }
@@ -0,0 +1,95 @@
+import sys
+import time
+from contextlib import contextmanager
+
+TOP_PACKAGES = 15  # сколько самых медленных пакетов показывать в отчете
+
+class _ImportTimer:
+    """Meta path finder, который замеряет выполнение каждого загружаемого модуля"""
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+
+    def find_spec(self, name, path=None, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is None:
+                continue
+            loader = spec.loader
+            # Встроенные и frozen модули загружаются классами - их не трогаем
+            if loader is not None and not isinstance(loader, type) and hasattr(loader, 'exec_module'):
+                try:
+                    loader.exec_module = self.profiler.timed(name, loader.exec_module)
+                except AttributeError:
+                    pass
+            return spec
+        return None
+
+class StartupProfiler:
+    """Время импорта модулей и шагов инициализации бота
+
+    Для модулей учитывается собственное время: вложенные импорты
+    засчитываются своим пакетам.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.imports = {}  # пакет верхнего уровня -> [секунды, число модулей]
+        self.steps = []  # (шаг, секунды)
+        self._children = []  # время вложенных импортов на каждом уровне
+        self._finder = None
+
+    def install(self):
+        if self._finder is None:
+            self._finder = _ImportTimer(self)
+            sys.meta_path.insert(0, self._finder)
+
+    def uninstall(self):
+        if self._finder is not None:
+            sys.meta_path.remove(self._finder)
+            self._finder = None
+
+    def timed(self, name, exec_module):
+        def wrapper(module):
+            self._children.append(0.0)
+            started = time.perf_counter()
+            try:
+                exec_module(module)
+            finally:
+                elapsed = time.perf_counter() - started
+                own = elapsed - self._children.pop()
+                if self._children:
+                    self._children[-1] += elapsed
+                package = self.imports.setdefault(name.partition('.')[0], [0.0, 0])
+                package[0] += own
+                package[1] += 1
+        return wrapper
+
+    @contextmanager
+    def step(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((name, time.perf_counter() - started))
+
+    def report(self, top=TOP_PACKAGES):
+        total = time.perf_counter() - self.started
+        imports = sorted(self.imports.items(), key=lambda item: item[1][0], reverse=True)
+        lines = [f"Запуск: {total:.3f} с", "", "Шаги инициализации:"]
+        lines += [f"  {name:<24} {seconds:8.3f} с" for name, seconds in self.steps]
+        lines += ["", f"Импорты: {sum(s for s, _ in self.imports.values()):.3f} с"]
+        lines += [
+            f"  {package:<24} {seconds:8.3f} с  ({count} мод.)"
+            for package, (seconds, count) in imports[:top]
+        ]
+        if len(imports) > top:
+            rest = imports[top:]
+            lines.append(
+                f"  {'остальные (' + str(len(rest)) + ')':<24} {sum(s for _, (s, _) in rest):8.3f} с"
+            )
+        return '\n'.join(lines)
+
+profiler = StartupProfiler()
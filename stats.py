@@ -0,0 +1,121 @@
+import time
+from collections import OrderedDict
+
+from sqlalchemy import select, func
+
+from models import P2PTransaction, UserBalance
+from config import STATS_CACHE_MAX_ENTRIES, STATS_CACHE_TTL
+
+LAST_TRANSACTIONS_LIMIT = 5
+
+class StatsCache:
+    """LRU-кэш статистики пользователей с ограничением по времени жизни"""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # user_id -> (expires_at, stats)
+        self._pending = {}  # user_id -> токен незавершенного расчета
+
+    def get(self, user_id):
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            expires_at, stats = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return stats
+            del self._entries[user_id]
+        self.misses += 1
+        return None
+
+    def begin(self, user_id):
+        """Отмечает начало расчета; результат сохранится, только если не было записи"""
+        token = object()
+        self._pending[user_id] = token
+        return token
+
+    def set(self, user_id, stats, token):
+        if self._pending.get(user_id) is not token:
+            return
+        del self._pending[user_id]
+        self._entries[user_id] = (time.monotonic() + self.ttl, stats)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, user_id):
+        self._entries.pop(user_id, None)
+        self._pending.pop(user_id, None)
+
+    def info(self):
+        return {
+            'size': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+stats_cache = StatsCache(STATS_CACHE_MAX_ENTRIES, STATS_CACHE_TTL)
+
+async def get_user_statistics(session, user_id):
+    """Возвращает статистику пользователя из кэша или считает ее заново"""
+    stats = stats_cache.get(user_id)
+    if stats is not None:
+        return stats
+
+    token = stats_cache.begin(user_id)
+    try:
+        stats = await compute_user_statistics(session, user_id)
+    except Exception:
+        stats_cache.invalidate(user_id)
+        raise
+    stats_cache.set(user_id, stats, token)
+    return stats
+
+async def compute_user_statistics(session, user_id):
+    """Берет итоги из user_balances, а для пользователей без них - одним агрегатом"""
+    stats = {
+        'buy': {'total': 0.0, 'count': 0, 'last': []},
+        'sell': {'total': 0.0, 'count': 0, 'last': []},
+    }
+
+    balance = await session.get(UserBalance, user_id)
+    if balance is not None:
+        totals = [
+            ('buy', balance.buy_total, balance.buy_count),
+            ('sell', balance.sell_total, balance.sell_count),
+        ]
+    else:
+        totals = await session.execute(
+            select(
+                P2PTransaction.transaction_type,
+                func.sum(P2PTransaction.amount),
+                func.count()
+            ).where(
+                P2PTransaction.user_id == user_id
+            ).group_by(P2PTransaction.transaction_type)
+        )
+    for transaction_type, total, count in totals:
+        if transaction_type in stats:
+            stats[transaction_type]['total'] = total or 0.0
+            stats[transaction_type]['count'] = count
+
+    # Последние операции читаем только для непустых типов
+    for transaction_type, type_stats in stats.items():
+        if not type_stats['count']:
+            continue
+        last = await session.execute(
+            select(P2PTransaction.date, P2PTransaction.amount).filter_by(
+                user_id=user_id,
+                transaction_type=transaction_type
+            ).order_by(P2PTransaction.date.desc()).limit(LAST_TRANSACTIONS_LIMIT)
+        )
+        type_stats['last'] = [(date, amount) for date, amount in last]
+
+    return stats
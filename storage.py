@@ -0,0 +1,167 @@
+import asyncio
+import json
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from sqlalchemy import delete, insert
+
+from models import FSMRecord
+from config import logger, FSM_STATE_TTL, FSM_CACHE_MAX_ENTRIES, FSM_FLUSH_INTERVAL
+
+class _Entry:
+    __slots__ = ('state', 'data', 'updated_at')
+
+    def __init__(self, state=None, data=None, updated_at=None):
+        self.state = state
+        self.data = data or {}
+        self.updated_at = updated_at or datetime.now()
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище в базе бота с отложенной записью и ограниченным кэшем в памяти
+
+    Изменения копятся в кэше и сбрасываются в таблицу fsm_states раз в
+    flush_interval секунд. Состояния, не менявшиеся дольше ttl, удаляются.
+    """
+
+    def __init__(self, session_factory, ttl=FSM_STATE_TTL,
+                 max_entries=FSM_CACHE_MAX_ENTRIES, flush_interval=FSM_FLUSH_INTERVAL):
+        self.session_factory = session_factory
+        self.ttl = timedelta(seconds=ttl)
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self._cache = OrderedDict()  # key -> _Entry
+        self._dirty = set()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+
+    @staticmethod
+    def _make_key(key: StorageKey) -> str:
+        return ':'.join(str(part) for part in (
+            key.bot_id, key.chat_id, key.user_id, key.thread_id,
+            key.business_connection_id, key.destiny
+        ))
+
+    def _is_expired(self, entry):
+        return entry.updated_at < datetime.now() - self.ttl
+
+    async def _load(self, key):
+        async with self.session_factory() as session:
+            record = await session.get(FSMRecord, key)
+        if record is None:
+            return _Entry()
+        return _Entry(record.state, json.loads(record.data or '{}'), record.updated_at)
+
+    async def _get_entry(self, key: StorageKey):
+        cache_key = self._make_key(key)
+        entry = self._cache.get(cache_key)
+        if entry is None:
+            loaded = await self._load(cache_key)
+            # Пока шла загрузка, запись мог завести параллельный апдейт - не затираем ее
+            entry = self._cache.setdefault(cache_key, loaded)
+            await self._trim()
+        if self._is_expired(entry) and (entry.state is not None or entry.data):
+            entry = self._cache[cache_key] = _Entry()
+            self._dirty.add(cache_key)
+        self._cache.move_to_end(cache_key)
+        return cache_key, entry
+
+    def _touch(self, cache_key, entry):
+        entry.updated_at = datetime.now()
+        self._dirty.add(cache_key)
+
+    async def _trim(self):
+        while len(self._cache) > self.max_entries:
+            cache_key = next(iter(self._cache))
+            if cache_key in self._dirty:
+                await self.flush()
+                continue
+            self._cache.pop(cache_key, None)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        cache_key, entry = await self._get_entry(key)
+        entry.state = state.state if isinstance(state, State) else state
+        self._touch(cache_key, entry)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        _, entry = await self._get_entry(key)
+        return entry.state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        cache_key, entry = await self._get_entry(key)
+        entry.data = dict(data)
+        self._touch(cache_key, entry)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, entry = await self._get_entry(key)
+        return entry.data.copy()
+
+    async def flush(self):
+        """Записывает накопленные изменения одной транзакцией"""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            keys = list(self._dirty)
+            self._dirty.clear()
+
+            rows = []
+            for cache_key in keys:
+                entry = self._cache.get(cache_key)
+                if entry is not None and (entry.state is not None or entry.data):
+                    rows.append({
+                        'key': cache_key,
+                        'state': entry.state,
+                        'data': json.dumps(entry.data, ensure_ascii=False, default=str),
+                        'updated_at': entry.updated_at,
+                    })
+
+            try:
+                async with self.session_factory() as session:
+                    await session.execute(delete(FSMRecord).where(FSMRecord.key.in_(keys)))
+                    if rows:
+                        await session.execute(insert(FSMRecord), rows)
+                    await session.commit()
+            except Exception:
+                # Не теряем изменения - повторим при следующем сбросе
+                self._dirty.update(keys)
+                raise
+
+    async def expire(self):
+        """Удаляет брошенные состояния из кэша и из базы"""
+        cutoff = datetime.now() - self.ttl
+        for cache_key, entry in list(self._cache.items()):
+            if entry.updated_at < cutoff:
+                self._cache.pop(cache_key, None)
+                self._dirty.discard(cache_key)
+
+        async with self.session_factory() as session:
+            await session.execute(delete(FSMRecord).where(FSMRecord.updated_at < cutoff))
+            await session.commit()
+
+    async def _run(self):
+        last_expire = datetime.now()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if datetime.now() - last_expire > self.ttl / 24:
+                    await self.expire()
+                    last_expire = datetime.now()
+            except Exception as e:
+                logger.error(f"FSM storage flush failed: {e}")
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
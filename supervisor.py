@@ -0,0 +1,258 @@
+import asyncio
+import hmac
+import os
+import secrets
+import signal
+import sys
+
+import aiohttp
+from aiohttp import web
+from aiogram import Bot
+
+from webhook import SECRET_HEADER, WORKER_UPDATE_PATH, WORKER_HEALTH_PATH
+from config import (
+    logger, BOT_MODE, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT,
+    WEBHOOK_MAX_CONCURRENCY, WORKER_BASE_PORT, WORKER_HEALTH_INTERVAL, WORKER_HEALTH_FAILURES,
+    WORKER_QUEUE_SIZE, METRICS_PORT, SEND_GLOBAL_RATE, BYBIT_RATE_LIMIT
+)
+
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bot.py')
+POLLING_TIMEOUT = 30  # seconds, long polling getUpdates
+FORWARD_RETRY_DELAY = 0.5
+RESTART_DELAY_MAX = 30
+STOP_TIMEOUT = 40  # seconds for a worker to drain before it is killed
+START_TIMEOUT = 60  # seconds for a new worker to pass its first health check
+# Поля апдейта, в которых Telegram передает автора события
+USER_FIELDS = ('from', 'user', 'voter_chat', 'chat')
+
+def update_user_id(update):
+    """Находит пользователя в сыром апдейте; 0, если апдейт ни к кому не относится"""
+    for key, event in update.items():
+        if key == 'update_id' or not isinstance(event, dict):
+            continue
+        for field in USER_FIELDS:
+            if isinstance(event.get(field), dict) and 'id' in event[field]:
+                return event[field]['id']
+        message = event.get('message')
+        if isinstance(message, dict) and 'chat' in message:
+            return message['chat']['id']
+    return 0
+
+def shard_of(user_id, count):
+    return user_id % count
+
+class Worker:
+    """Рабочий процесс бота, его очередь апдейтов и состояние проверок"""
+
+    def __init__(self, index, count, secret):
+        self.index = index
+        self.count = count
+        self.secret = secret
+        self.port = WORKER_BASE_PORT + index
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.queue = asyncio.Queue(maxsize=WORKER_QUEUE_SIZE)
+        self.process = None
+        self.started_at = 0.0
+        self.ready = False
+        self.failures = 0
+        self.restarts = 0
+
+    def environment(self):
+        env = dict(os.environ)
+        env.update({
+            'BOT_MODE': 'worker',
+            'BOT_WORKERS': '1',
+            'WORKER_INDEX': str(self.index),
+            'WORKER_COUNT': str(self.count),
+            'WORKER_PORT': str(self.port),
+            'WORKER_SECRET': self.secret,
+            # У каждого процесса свой порт метрик и своя доля общих лимитов
+            'METRICS_PORT': str(METRICS_PORT + self.index if METRICS_PORT else 0),
+            'SEND_GLOBAL_RATE': str(SEND_GLOBAL_RATE / self.count),
+            'BYBIT_RATE_LIMIT': str(BYBIT_RATE_LIMIT / self.count),
+        })
+        return env
+
+    async def spawn(self):
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, BOT_SCRIPT, env=self.environment()
+        )
+        self.started_at = asyncio.get_running_loop().time()
+        self.ready = False
+        self.failures = 0
+        logger.info(f"Started worker {self.index} (pid {self.process.pid}) on port {self.port}")
+
+    async def forward(self, http):
+        """Передает апдейты рабочему процессу по порядку, пока тот не примет каждый"""
+        while True:
+            update = await self.queue.get()
+            try:
+                while True:
+                    try:
+                        async with http.post(
+                            self.url + WORKER_UPDATE_PATH, json=update,
+                            headers={SECRET_HEADER: self.secret}
+                        ) as response:
+                            if response.status == 200:
+                                break
+                            logger.warning(f"Worker {self.index} answered {response.status}, retrying")
+                    except aiohttp.ClientError:
+                        pass
+                    # Процесс перезапускается или дренирует очередь - апдейт дождется его
+                    await asyncio.sleep(FORWARD_RETRY_DELAY)
+            finally:
+                self.queue.task_done()
+
+    async def check(self, http):
+        try:
+            async with http.get(self.url + WORKER_HEALTH_PATH,
+                                timeout=aiohttp.ClientTimeout(total=WORKER_HEALTH_INTERVAL)) as response:
+                return response.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return False
+
+    def kill(self):
+        try:
+            self.process.kill()
+        except ProcessLookupError:
+            pass
+
+    async def stop(self):
+        if self.process is None or self.process.returncode is not None:
+            return
+        self.process.terminate()
+        try:
+            await asyncio.wait_for(self.process.wait(), STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.kill()
+            await self.process.wait()
+
+class Supervisor:
+    """Принимает апдейты и распределяет их по рабочим процессам по user_id"""
+
+    def __init__(self, bot: Bot, workers):
+        secret = secrets.token_urlsafe(32)
+        self.bot = bot
+        self.workers = [Worker(index, workers, secret) for index in range(workers)]
+        self.stopping = False
+
+    async def route(self, update):
+        worker = self.workers[shard_of(update_user_id(update), len(self.workers))]
+        # Очередь ограничена: при медленном процессе прием апдейтов притормаживает
+        await worker.queue.put(update)
+
+    async def _watch(self, worker):
+        delay = 1
+        while not self.stopping:
+            code = await worker.process.wait()
+            if self.stopping:
+                return
+            if asyncio.get_running_loop().time() - worker.started_at > RESTART_DELAY_MAX:
+                delay = 1
+            worker.restarts += 1
+            logger.error(f"Worker {worker.index} exited with code {code}, restarting in {delay}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RESTART_DELAY_MAX)
+            await worker.spawn()
+
+    async def _health(self, http):
+        while not self.stopping:
+            await asyncio.sleep(WORKER_HEALTH_INTERVAL)
+            for worker in self.workers:
+                if worker.process.returncode is not None:
+                    continue
+                if await worker.check(http):
+                    worker.ready = True
+                    worker.failures = 0
+                    continue
+                if not worker.ready:
+                    # Новый процесс еще загружается - ждем до START_TIMEOUT
+                    if asyncio.get_running_loop().time() - worker.started_at > START_TIMEOUT:
+                        logger.error(f"Worker {worker.index} did not start in {START_TIMEOUT}s, killing")
+                        worker.kill()
+                    continue
+                worker.failures += 1
+                if worker.failures >= WORKER_HEALTH_FAILURES:
+                    logger.error(f"Worker {worker.index} failed {worker.failures} health checks, killing")
+                    worker.kill()
+
+    async def poll(self):
+        await self.bot.delete_webhook()
+        offset = None
+        while True:
+            try:
+                updates = await self.bot.get_updates(offset=offset, timeout=POLLING_TIMEOUT)
+            except Exception as e:
+                logger.error(f"Failed to get updates: {e}")
+                await asyncio.sleep(FORWARD_RETRY_DELAY)
+                continue
+            for update in updates:
+                await self.route(update.model_dump(mode='json', exclude_unset=True, by_alias=True))
+                offset = update.update_id + 1
+
+    async def receive_webhooks(self):
+        if not WEBHOOK_URL or not WEBHOOK_SECRET:
+            raise RuntimeError("WEBHOOK_URL and WEBHOOK_SECRET must be set in webhook mode")
+
+        async def handle(request: web.Request) -> web.Response:
+            if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ''), WEBHOOK_SECRET):
+                return web.Response(status=401)
+            await self.route(await request.json())
+            return web.Response()
+
+        app = web.Application()
+        app.router.add_post(WEBHOOK_PATH, handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+            await self.bot.set_webhook(
+                url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                max_connections=min(WEBHOOK_MAX_CONCURRENCY, 100)
+            )
+            logger.info(f"Supervisor webhook listening on {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+
+    async def run(self):
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+
+        for worker in self.workers:
+            await worker.spawn()
+
+        async with aiohttp.ClientSession() as http:
+            tasks = [asyncio.create_task(worker.forward(http)) for worker in self.workers]
+            tasks += [asyncio.create_task(self._watch(worker)) for worker in self.workers]
+            tasks.append(asyncio.create_task(self._health(http)))
+            intake = self.receive_webhooks() if BOT_MODE == 'webhook' else self.poll()
+            tasks.append(asyncio.create_task(intake))
+            logger.info(f"Supervisor started {len(self.workers)} workers")
+
+            stopped = asyncio.create_task(stop_event.wait())
+            done, _ = await asyncio.wait([stopped, tasks[-1]], return_when=asyncio.FIRST_COMPLETED)
+            self.stopping = True
+            tasks[-1].cancel()
+            # Принятые апдейты доставляем до остановки процессов
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(*(worker.queue.join() for worker in self.workers)), STOP_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                logger.warning("Dropping undelivered updates on shutdown")
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*(worker.stop() for worker in self.workers))
+            for task in done:
+                if task is not stopped and not task.cancelled() and task.exception():
+                    raise task.exception()
+
+async def run_supervisor(bot: Bot, workers):
+    try:
+        await Supervisor(bot, workers).run()
+    finally:
+        await bot.session.close()
@@ -0,0 +1,121 @@
+import asyncio
+import hmac
+import signal
+
+from aiohttp import web
+from aiogram.types import Update
+
+from config import (
+    logger, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST,
+    WEBHOOK_PORT, WEBHOOK_MAX_CONCURRENCY, WEBHOOK_DRAIN_TIMEOUT,
+    WORKER_PORT, WORKER_SECRET, WORKER_INDEX
+)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+WORKER_UPDATE_PATH = '/update'
+WORKER_HEALTH_PATH = '/health'
+
+class WebhookHandler:
+    """Принимает апдейты по HTTP и передает их диспетчеру с ограничением параллельности"""
+
+    def __init__(self, dp, bot, secret, max_concurrency):
+        self.dp = dp
+        self.bot = bot
+        self.secret = secret
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.closing = False
+        self._tasks = set()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ''), self.secret):
+            return web.Response(status=401)
+        if self.closing:
+            # Telegram повторит доставку после перезапуска
+            return web.Response(status=503)
+
+        update = Update.model_validate(await request.json(), context={'bot': self.bot})
+        # Пока все слоты заняты, не подтверждаем апдейт - Telegram придержит новые
+        await self.semaphore.acquire()
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def _process(self, update):
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            logger.error(f"Error processing update {update.update_id}: {e}")
+        finally:
+            self.semaphore.release()
+
+    async def health(self, request: web.Request) -> web.Response:
+        if self.closing:
+            return web.Response(status=503)
+        return web.json_response({'in_flight': len(self._tasks)})
+
+    async def drain(self, timeout):
+        """Перестает принимать апдейты и ждет завершения начатых хендлеров"""
+        self.closing = True
+        if self._tasks:
+            logger.info(f"Waiting for {len(self._tasks)} in-flight updates")
+            await asyncio.wait(self._tasks, timeout=timeout)
+
+async def serve(dp, bot, handler, app, host, port, on_listening=None, **runner_options):
+    """Запускает HTTP-сервер с диспетчером и останавливает его по SIGINT/SIGTERM"""
+    runner = web.AppRunner(app, **runner_options)
+    await runner.setup()
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    workflow_data = {'dispatcher': dp, 'bots': [bot], 'bot': bot, **dp.workflow_data}
+    await dp.emit_startup(**workflow_data)
+    try:
+        await web.TCPSite(runner, host, port).start()
+        if on_listening is not None:
+            await on_listening()
+        await stop_event.wait()
+    finally:
+        logger.info("Shutting down webhook server")
+        await handler.drain(WEBHOOK_DRAIN_TIMEOUT)
+        await runner.cleanup()
+        await dp.emit_shutdown(**workflow_data)
+        await bot.session.close()
+
+async def run_webhook(dp, bot):
+    if not WEBHOOK_URL or not WEBHOOK_SECRET:
+        raise RuntimeError("WEBHOOK_URL and WEBHOOK_SECRET must be set in webhook mode")
+
+    handler = WebhookHandler(dp, bot, WEBHOOK_SECRET, WEBHOOK_MAX_CONCURRENCY)
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handler.handle)
+
+    async def set_webhook():
+        await bot.set_webhook(
+            url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=min(WEBHOOK_MAX_CONCURRENCY, 100)
+        )
+        logger.info(f"Webhook server listening on {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+    await serve(dp, bot, handler, app, WEBHOOK_HOST, WEBHOOK_PORT, set_webhook)
+
+async def run_worker(dp, bot):
+    """Режим рабочего процесса: апдейты приходят от супервизора на локальный порт"""
+    if not WORKER_SECRET:
+        raise RuntimeError("WORKER_SECRET must be set in worker mode")
+
+    handler = WebhookHandler(dp, bot, WORKER_SECRET, WEBHOOK_MAX_CONCURRENCY)
+    app = web.Application()
+    app.router.add_post(WORKER_UPDATE_PATH, handler.handle)
+    app.router.add_get(WORKER_HEALTH_PATH, handler.health)
+
+    async def log_listening():
+        logger.info(f"Worker {WORKER_INDEX} listening on 127.0.0.1:{WORKER_PORT}")
+
+    # Супервизор обращается к процессу на каждый апдейт и проверку - журнал запросов не нужен
+    await serve(dp, bot, handler, app, '127.0.0.1', WORKER_PORT, log_listening, access_log=None)
@@ -0,0 +1,92 @@
+import asyncio
+
+from sqlalchemy.exc import OperationalError
+
+from config import logger, WRITE_BATCH_WINDOW, WRITE_BATCH_MAX_SIZE
+
+class WriteBatcher:
+    """Групповой коммит: записи, пришедшие в пределах окна, идут одной транзакцией
+
+    Операция - async-функция, принимающая сессию и вносящая изменения без
+    commit. submit() возвращает ее результат только после коммита пачки.
+    """
+
+    def __init__(self, session_factory, window=WRITE_BATCH_WINDOW, max_size=WRITE_BATCH_MAX_SIZE):
+        self.session_factory = session_factory
+        self.window = window
+        self.max_size = max_size
+        self.queue = asyncio.Queue()
+        self.batches = 0
+        self.writes = 0
+        self._task = None
+
+    async def submit(self, operation):
+        if self._task is None:
+            await self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((operation, future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _commit(self, batch):
+        try:
+            async with self.session_factory() as session:
+                results = [await operation(session) for operation, _ in batch]
+                await session.commit()
+        except Exception as e:
+            # Блокировка или сбой базы касаются всей пачки: повтор по одной
+            # операции ждал бы busy_timeout на каждой
+            if len(batch) == 1 or isinstance(e, OperationalError):
+                if len(batch) > 1:
+                    logger.error(f"Write batch of {len(batch)} failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            # Ошибка в данных одной из операций - ищем виновника, повторяя их по одной
+            logger.error(f"Write batch of {len(batch)} failed, retrying individually: {e}")
+            for item in batch:
+                await self._commit([item])
+            return
+
+        self.batches += 1
+        self.writes += len(batch)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            try:
+                await self._commit(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            await self.queue.join()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None